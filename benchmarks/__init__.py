@@ -0,0 +1,15 @@
+"""
+Benchmarks for the API, run them from the repository root:
+
+    python -m benchmarks --scale small --output results.json
+    python -m benchmarks.compare before.json after.json
+
+The app modules import each other by their bare names, so src/ goes on the
+path here once for every benchmark module.
+"""
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
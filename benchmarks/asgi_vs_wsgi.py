@@ -0,0 +1,71 @@
+"""
+Throughput of the WSGI entry point (gunicorn sync workers) against the ASGI
+one (uvicorn) at high concurrency, on the generated SQLite dataset:
+
+    python -m benchmarks.asgi_vs_wsgi --concurrency 256 --requests 20000
+
+Only the read routes asgi.py answers with its own async handlers are
+requested, everything else goes through WsgiToAsgi there and would measure
+the adapter rather than the async path.
+
+Set DATABASE_URL to a Postgres database to compare psycopg2 against asyncpg.
+"""
+import os
+import sys
+import json
+import argparse
+from benchmarks import SRC
+from benchmarks.dataset import SCALES
+from benchmarks.routes import Route, ROUTES
+from benchmarks.runner import DEFAULT_DATABASE, gunicorn_command, http_caller, load_dataset, run_route, serve
+
+SERVERS = {
+    'wsgi': gunicorn_command,
+    'asgi': lambda port, workers: ['uvicorn', 'asgi:application', '--app-dir', SRC,
+                                   '--workers', str(workers), '--port', str(port), '--log-level', 'warning'],
+}
+# Every route match_route in asgi.py sends to an async handler
+ASYNC_ROUTES = ('GET /users', 'GET /people', 'GET /planets', 'GET /vehicles',
+                'GET /users/<id>', 'GET /people/<id>', 'GET /planets/<id>', 'GET /vehicles/<id>',
+                'GET /users/<id>/favorites')
+
+
+def mixed_route():
+    routes = [route for route in ROUTES if route.name in ASYNC_ROUTES]
+    return Route('GET mixed async reads', 'GET', lambda context: context.rng.choice(routes).request(context))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+    os.environ['CACHE_BACKEND'] = 'memory'
+    from app import app
+    counts = load_dataset(app, args.database, SCALES[args.scale], args.seed, False,
+                          lambda message: print(message, file=sys.stderr))
+
+    route = mixed_route()
+    results = []
+    for offset, (name, command) in enumerate(SERVERS.items()):
+        port = args.port + offset
+        with serve(command(port, args.workers), port, dict(os.environ)):
+            result = run_route(route, lambda: http_caller(port), counts, args.seed,
+                               args.requests, 0, args.concurrency)
+        results.append({'server': name, 'route': route.name, 'routes': ASYNC_ROUTES, **result})
+    print(json.dumps(results, indent=2))
+    failed = [result['server'] for result in results if result['errors']]
+    if failed:
+        sys.exit('Requests failed on ' + ', '.join(failed) + ', see statuses')
+
+
+if __name__ == '__main__':
+    main()
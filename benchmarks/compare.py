@@ -0,0 +1,38 @@
+"""
+Compare two result files of python -m benchmarks:
+
+    python -m benchmarks.compare before.json after.json
+"""
+import sys
+import json
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+
+
+def load(path):
+    with open(path) as file:
+        report = json.load(file)
+    return {(result['mode'], result['route']): result for result in report['results']}
+
+
+def change(before, after):
+    if not before or after is None:
+        return '     n/a'
+    return f'{(after - before) / before * 100:+7.1f}%'
+
+
+def main(argv):
+    if len(argv) != 2:
+        sys.exit(__doc__.strip())
+    before, after = load(argv[0]), load(argv[1])
+    print(f'{"mode":8} {"route":48} ' + ' '.join(f'{metric:>16}' for metric in METRICS))
+    for key in sorted(before.keys() & after.keys()):
+        cells = [f'{after[key][metric] or 0:>8} {change(before[key][metric], after[key][metric])}'
+                 for metric in METRICS]
+        print(f'{key[0]:8} {key[1]:48} ' + ' '.join(cells))
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f'{key[0]:8} {key[1]:48} only in {"before" if key in before else "after"}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+"""Seeded synthetic Star Wars data at a configurable scale"""
+import random
+from itertools import accumulate, islice
+
+SCALES = {
+    'small': {'users': 1000, 'characters': 1000, 'planets': 200, 'vehicles': 200},
+    'medium': {'users': 10000, 'characters': 10000, 'planets': 2000, 'vehicles': 2000},
+    'large': {'users': 100000, 'characters': 1000000, 'planets': 20000, 'vehicles': 20000},
+}
+BATCH_SIZE = 10000
+# Every generated user logs in with this password
+DATASET_PASSWORD = 'benchmark'
+# Favorites per user follow a geometric distribution with this mean, and the
+# favorited items a Zipf-like one, so a few items collect most favorites
+FAVORITES_PER_USER = {'characters': 6, 'planets': 3, 'vehicles': 2}
+POPULARITY_EXPONENT = 1.1
+
+FIRST_NAMES = ['Luke', 'Leia', 'Han', 'Anakin', 'Padme', 'Obi-Wan', 'Rey', 'Finn', 'Poe', 'Jyn',
+               'Cassian', 'Lando', 'Mace', 'Ahsoka', 'Din', 'Bo-Katan', 'Hera', 'Kanan', 'Sabine', 'Ezra']
+LAST_NAMES = ['Skywalker', 'Organa', 'Solo', 'Kenobi', 'Amidala', 'Fett', 'Antilles', 'Calrissian',
+              'Windu', 'Tano', 'Djarin', 'Kryze', 'Syndulla', 'Jarrus', 'Wren', 'Bridger', 'Erso', 'Andor']
+GENDERS = ['male', 'female', 'n/a', 'hermaphrodite']
+CLIMATES = ['arid', 'temperate', 'tropical', 'frozen', 'murky', 'windy', 'humid', 'polluted']
+TERRAINS = ['desert', 'grasslands', 'mountains', 'jungle', 'ocean', 'tundra', 'swamp', 'cityscape',
+            'forests', 'volcanoes']
+VEHICLE_NAMES = ['Speeder', 'Skiff', 'Walker', 'Crawler', 'Cloud Car', 'Snowspeeder', 'Bomber',
+                 'Starfighter', 'Shuttle', 'Transport']
+VEHICLE_MODELS = ['T-47', 'Bantha-II', 'AT-AT', 'AT-ST', 'Storm IV', 'TIE/LN', 'T-65 X-wing',
+                  'BTL Y-wing', 'Lambda-class', 'Digger Crawler']
+
+
+def user_rows(rng, count, password):
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {'email': f'{first.lower()}.{last.lower()}{i}@example.com', 'password': password,
+               'username': f'{first.lower()}{i}', 'first_name': first, 'last_name': last}
+
+
+def character_rows(rng, count):
+    for i in range(1, count + 1):
+        yield {'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}',
+               'gender': rng.choice(GENDERS), 'height': rng.randint(60, 250),
+               'weight': rng.randint(20, 180), 'birthdate': f'{rng.randint(0, 900)}BBY'}
+
+
+def planet_rows(rng, count):
+    for i in range(1, count + 1):
+        yield {'planet_name': f'{rng.choice(LAST_NAMES)} {i}', 'climate': rng.choice(CLIMATES),
+               'terrain': rng.choice(TERRAINS), 'day_length_hours': rng.randint(12, 60),
+               'year_length_days': rng.randint(200, 5000), 'population': rng.randint(0, 10**9)}
+
+
+def vehicle_rows(rng, count):
+    for i in range(1, count + 1):
+        yield {'vehicle_name': f'{rng.choice(VEHICLE_NAMES)} {i}',
+               'cargo_capacity': round(rng.uniform(0, 1000), 1), 'number_passengers': rng.randint(0, 40),
+               'number_crew': rng.randint(1, 10), 'model': rng.choice(VEHICLE_MODELS),
+               'cost': rng.randint(1000, 10**6)}
+
+
+def favorite_rows(rng, users, items, column, mean):
+    # Popularity ranks are shuffled so popular items are spread over the ids
+    order = list(range(1, items + 1))
+    rng.shuffle(order)
+    weights = list(accumulate(1 / rank ** POPULARITY_EXPONENT for rank in range(1, items + 1)))
+    for user_id in range(1, users + 1):
+        wanted = min(int(rng.expovariate(1 / mean)), items)
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.update(rng.choices(order, cum_weights=weights, k=wanted - len(chosen)))
+        for item_id in chosen:
+            yield {'user_id': user_id, column: item_id}
+
+
+def insert_rows(db, model, rows):
+    total = 0
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return total
+        db.session.execute(db.insert(model), batch)
+        db.session.commit()
+        total += len(batch)
+
+
+def generate(app, users, characters, planets, vehicles, seed=42, log=print):
+    """Drop and recreate every table, then fill them with deterministic rows"""
+    from models import db, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
+    from favorites import reconcile_favorite_counts
+    from auth import hash_password
+
+    rng = random.Random(seed)
+    tables = [
+        # One hash shared by every user, hashing each would take minutes
+        (User, user_rows(rng, users, hash_password(DATASET_PASSWORD))),
+        (Characters, character_rows(rng, characters)),
+        (Planets, planet_rows(rng, planets)),
+        (Vehicles, vehicle_rows(rng, vehicles)),
+        (FavoriteCharacters, favorite_rows(rng, users, characters, 'character_id',
+                                           FAVORITES_PER_USER['characters'])),
+        (FavoritePlanets, favorite_rows(rng, users, planets, 'planet_id', FAVORITES_PER_USER['planets'])),
+        (FavoriteVehicles, favorite_rows(rng, users, vehicles, 'vehicle_id', FAVORITES_PER_USER['vehicles'])),
+    ]
+    counts = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for model, rows in tables:
+            counts[model.__tablename__] = insert_rows(db, model, rows)
+            log(f'{model.__tablename__}: {counts[model.__tablename__]} rows')
+        # Bulk inserts skip the flush that keeps favorite_count up to date
+        reconcile_favorite_counts()
+    return counts
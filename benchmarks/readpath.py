@@ -0,0 +1,70 @@
+"""
+Time and memory per row of the read path: ORM instances against the row
+classes from rows.py, each loaded and turned into serialize() dicts:
+
+    python -m benchmarks.readpath --rows 100000
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+import argparse
+from benchmarks.dataset import SCALES
+from benchmarks.runner import DEFAULT_DATABASE, load_dataset
+
+
+def measure(function, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # A separate traced run, tracemalloc slows allocation down a lot
+    tracemalloc.start()
+    loaded = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del loaded
+    return {'seconds': round(best, 4), 'us_per_row': round(best / rows * 1e6, 2),
+            'peak_bytes_per_row': round(peak / rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=DEFAULT_DATABASE.replace('.db', '-serialization.db'))
+    parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+    os.environ['CACHE_BACKEND'] = 'memory'
+    from app import app
+    from models import db, Characters
+    from rows import select_rows, fetch_rows
+
+    scale = dict(SCALES['small'], characters=args.rows)
+    load_dataset(app, args.database, scale, args.seed, False, lambda message: print(message, file=sys.stderr))
+
+    def orm_instances():
+        characters = db.session.execute(db.select(Characters)).scalars().all()
+        payloads = [character.serialize() for character in characters]
+        # Keep the instances alive until measured, as a request handler would
+        db.session.expunge_all()
+        return characters, payloads
+
+    def row_objects():
+        rows = fetch_rows(select_rows(Characters), Characters)
+        return rows, [row.serialize() for row in rows]
+
+    results = []
+    with app.app_context():
+        for name, function in (('orm instances', orm_instances), ('row objects', row_objects)):
+            results.append(dict(case=name, rows=args.rows, **measure(function, args.rows, args.repeat)))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
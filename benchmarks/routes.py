@@ -0,0 +1,133 @@
+"""Every route of src/app.py with a generator for its path and body"""
+import uuid
+from collections import namedtuple
+
+# request(context) returns (path, json body or None), plus a dict of request
+# headers when it needs any. Setup it needs, like creating the row a DELETE
+# removes, goes through context.call untimed.
+Route = namedtuple('Route', ['name', 'method', 'request'])
+
+KIND_TABLES = {'users': 'user', 'people': 'characters', 'planets': 'planets', 'vehicles': 'vehicles'}
+UPDATES = {'users': 'first_name', 'people': 'weight', 'planets': 'population', 'vehicles': 'cost'}
+
+
+class Context:
+    def __init__(self, rng, counts, call):
+        self.rng = rng
+        self.counts = counts
+        self.call = call
+
+    def random_id(self, kind):
+        return self.rng.randint(1, self.counts[KIND_TABLES[kind]])
+
+    def unique(self):
+        # Not from the seeded rng, rows inserted by an earlier run are still there
+        return uuid.uuid4().hex[:16]
+
+    def row(self, kind):
+        suffix = self.unique()
+        return {
+            'users': {'email': f'bench{suffix}@example.com', 'password': 'benchmark',
+                      'username': f'bench{suffix}', 'first_name': 'Wedge', 'last_name': 'Antilles'},
+            'people': {'name': f'Clone {suffix}', 'gender': 'male', 'height': 183, 'weight': 78,
+                       'birthdate': '32BBY'},
+            'planets': {'planet_name': f'Outpost {suffix}', 'climate': 'frozen', 'terrain': 'tundra',
+                        'day_length_hours': 23, 'year_length_days': 549, 'population': 0},
+            'vehicles': {'vehicle_name': f'Speeder {suffix}', 'cargo_capacity': 5.0,
+                         'number_passengers': 1, 'number_crew': 1, 'model': 'T-47', 'cost': 8000},
+        }[kind]
+
+    def create(self, kind):
+        status, body = self.call('POST', f'/{kind}/bulk', [self.row(kind)])
+        if status != 201 or not body['inserted']:
+            raise RuntimeError(f'Could not create a row in /{kind}: {body}')
+        return body['inserted'][0]
+
+
+def get(path):
+    return lambda context: (path, None)
+
+
+def crud_routes(kind, filtered):
+    return [
+        Route(f'GET /{kind}', 'GET', get(f'/{kind}?limit=100')),
+        Route(f'GET /{kind}?filter', 'GET', get(f'/{kind}?{filtered}&limit=100')),
+        Route(f'GET /{kind}/<id>', 'GET', lambda context: (f'/{kind}/{context.random_id(kind)}', None)),
+        Route(f'POST /{kind}', 'POST', lambda context: (f'/{kind}', context.row(kind))),
+        Route(f'POST /{kind}/bulk', 'POST',
+              lambda context: (f'/{kind}/bulk', [context.row(kind) for _ in range(100)])),
+        Route(f'PUT /{kind}/<id>', 'PUT', lambda context: (
+            f'/{kind}/{context.random_id(kind)}', {UPDATES[kind]: context.row(kind)[UPDATES[kind]]})),
+        Route(f'DELETE /{kind}/<id>', 'DELETE', lambda context: (f'/{kind}/{context.create(kind)}', None)),
+    ]
+
+
+def favorite_routes(kind):
+    def favorite(context):
+        return f'/favorite/{kind}/{context.random_id(kind)}/user/{context.random_id("users")}', None
+
+    def unfavorite(context):
+        # Favorite it first so the DELETE removes a row, not a 404 for most pairs
+        path, body = favorite(context)
+        context.call('POST', path)
+        return path, body
+
+    return [
+        Route(f'GET /{kind}/<id>/related', 'GET',
+              lambda context: (f'/{kind}/{context.random_id(kind)}/related', None)),
+        Route(f'POST /favorite/{kind}/<id>/user/<user_id>', 'POST', favorite),
+        Route(f'DELETE /favorite/{kind}/<id>/user/<user_id>', 'DELETE', unfavorite),
+        Route(f'GET /leaderboard/{kind}', 'GET', get(f'/leaderboard/{kind}?top=20')),
+    ]
+
+
+def batch_favorites(context):
+    kinds = ('people', 'planets', 'vehicles')
+    operations = []
+    for _ in range(20):
+        kind = context.rng.choice(kinds)
+        operations.append({'kind': kind, 'op': context.rng.choice(('add', 'remove')),
+                           'user_id': context.random_id('users'), 'entity_id': context.random_id(kind)})
+    return '/favorites/batch', {'operations': operations}
+
+
+def login(context):
+    row = context.row('users')
+    context.call('POST', '/users/bulk', [row])
+    return '/login', {'email': row['email'], 'password': row['password']}
+
+
+def logout(context):
+    status, body = context.call('POST', *login(context))
+    if status != 200:
+        raise RuntimeError(f'Could not log in: {body}')
+    return '/logout', None, {'Authorization': f"Bearer {body['token']}"}
+
+
+ROUTES = [
+    Route('GET /', 'GET', get('/')),
+    Route('GET /user', 'GET', get('/user')),
+    Route('GET /internal/cache', 'GET', get('/internal/cache')),
+    Route('GET /internal/pool', 'GET', get('/internal/pool')),
+    Route('GET /internal/compression', 'GET', get('/internal/compression')),
+    Route('GET /metrics', 'GET', get('/metrics')),
+    Route('POST /login', 'POST', login),
+    Route('POST /logout', 'POST', logout),
+    *crud_routes('users', 'last_name=Skywalker'),
+    *crud_routes('people', 'gender=female&height_gte=180&sort=-height'),
+    *crud_routes('planets', 'climate=arid&sort=planet_name'),
+    *crud_routes('vehicles', 'cost_lt=50000&sort=-cost'),
+    Route('GET /people?fields', 'GET', get('/people?fields=name,gender&limit=100')),
+    Route('GET /planets?stream', 'GET', get('/planets?stream=1')),
+    *favorite_routes('people'),
+    *favorite_routes('planets'),
+    *favorite_routes('vehicles'),
+    Route('POST /favorites/batch', 'POST', batch_favorites),
+    Route('GET /users/<id>/favorites', 'GET',
+          lambda context: (f'/users/{context.random_id("users")}/favorites', None)),
+    Route('GET /search', 'GET', lambda context: (
+        '/search?q=' + context.rng.choice(['sky', 'solo', 'arid+desert', 'speeder', 'kenobi']), None)),
+    # A whole table per request, planets is the smallest one at every scale
+    Route('GET /export/<table>', 'GET', get('/export/planets?format=ndjson')),
+    Route('GET /export/<table>?gzip', 'GET', get('/export/planets?format=csv&compression=gzip')),
+]
@@ -0,0 +1,242 @@
+"""Latency and throughput of every route, in process and over HTTP"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import http.client
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import SRC
+from benchmarks.dataset import SCALES, generate
+from benchmarks.routes import ROUTES, Context
+
+DEFAULT_DATABASE = os.path.join('/tmp', 'starwars-bench.db')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def succeeded(status):
+    return 200 <= status < 400
+
+
+def summarize(latencies, statuses, elapsed):
+    """Latencies are of the successful requests only, a fast 404 or 500
+    would make a broken route look quick"""
+    latencies = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not succeeded(status))
+    return {
+        'requests': sum(statuses.values()),
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def client_caller(app):
+    client = app.test_client()
+
+    def call(method, path, body=None, headers=None):
+        response = client.open(path, method=method, json=body, headers=headers)
+        # Streamed bodies, e.g. exports, are only generated as they are read
+        response.get_data()
+        return response.status_code, response.get_json(silent=True)
+    return call
+
+
+def http_caller(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def call(method, path, body=None, headers=None):
+        nonlocal connection
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        payload = json.dumps(body) if body is not None else None
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            return 599, None
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+    return call
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/user')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+@contextmanager
+def serve(command, port, env=None):
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        yield
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def gunicorn_command(port, workers):
+    return ['gunicorn', 'wsgi', '--chdir', SRC, '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+
+
+def run_worker(route, make_caller, counts, seed, iterations, warmup):
+    call = make_caller()
+    context = Context(random.Random(seed), counts, call)
+    latencies, statuses = [], Counter()
+    for i in range(warmup + iterations):
+        path, body, *headers = route.request(context)
+        start = time.perf_counter()
+        status, _ = call(route.method, path, body, *headers)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            statuses[status] += 1
+            if succeeded(status):
+                latencies.append(elapsed)
+    return latencies, statuses
+
+
+def run_route(route, make_caller, counts, seed, iterations, warmup, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(
+            lambda worker: run_worker(route, make_caller, counts, seed + worker,
+                                      iterations // concurrency, warmup),
+            range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for batch, _ in results for latency in batch]
+    statuses = sum((statuses for _, statuses in results), Counter())
+    return summarize(latencies, statuses, elapsed)
+
+
+def load_dataset(app, database, scale, seed, regenerate, log):
+    # The generated database is reused while its parameters match, rebuilding
+    # the large scale takes minutes
+    meta_path = database + '.json'
+    params = {'scale': scale, 'seed': seed}
+    if not regenerate and os.path.exists(database) and os.path.exists(meta_path):
+        with open(meta_path) as meta:
+            saved = json.load(meta)
+        if saved['params'] == params:
+            return saved['counts']
+    counts = generate(app, seed=seed, log=log, **scale)
+    with open(meta_path, 'w') as meta:
+        json.dump({'params': params, 'counts': counts}, meta)
+    return counts
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark every route of the API.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for table in SCALES['small']:
+        parser.add_argument(f'--{table}', type=int, help=f'Override the number of {table}')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='SQLite file to generate into')
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the dataset even if it matches')
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per route and worker')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads against gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--routes', help='Only run routes whose name contains this text')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scale = dict(SCALES[args.scale])
+    for table in scale:
+        if getattr(args, table) is not None:
+            scale[table] = getattr(args, table)
+    log = lambda message: print(message, file=sys.stderr)
+
+    # Configure the app before it is imported, a per-run memory cache keeps
+    # runs independent of each other
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+    os.environ['CACHE_BACKEND'] = 'memory'
+    os.environ.setdefault('TOKEN_SECRET', 'benchmark')
+    from app import app
+
+    counts = load_dataset(app, args.database, scale, args.seed, args.regenerate, log)
+    routes = [route for route in ROUTES if not args.routes or args.routes in route.name]
+    modes = ('client', 'gunicorn') if args.mode == 'both' else (args.mode,)
+
+    results, failed = [], []
+    for mode in modes:
+        if mode == 'client':
+            make_caller, concurrency, server = (lambda: client_caller(app)), 1, None
+        else:
+            make_caller, concurrency = (lambda: http_caller(args.port)), args.concurrency
+            server = serve(gunicorn_command(args.port, args.workers), args.port, dict(os.environ))
+        with server or nullcontext():
+            for route in routes:
+                log(f'{mode}: {route.name}')
+                result = run_route(route, make_caller, counts, args.seed, args.iterations,
+                                   args.warmup, concurrency)
+                results.append({'route': route.name, 'mode': mode, **result})
+                if result['errors']:
+                    log(f"{mode}: {route.name}: {result['errors']} of {result['requests']} "
+                        f"requests failed {result['statuses']}")
+                    failed.append(f'{mode}: {route.name}')
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                 'revision': git_revision(),
+                 'python': platform.python_version(),
+                 'platform': platform.platform(),
+                 'seed': args.seed,
+                 'scale': args.scale,
+                 'rows': counts,
+                 'iterations': args.iterations,
+                 'warmup': args.warmup,
+                 'concurrency': args.concurrency,
+                 'workers': args.workers},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    if failed:
+        sys.exit('Routes answered with errors, their timings leave those requests out:\n  '
+                 + '\n  '.join(failed))
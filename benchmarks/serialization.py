@@ -0,0 +1,78 @@
+"""
+Encoding 100k characters to JSON: ORM instances and serialize() against
+row tuples through the precompiled row encoder, with each JSON provider:
+
+    python -m benchmarks.serialization --rows 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from benchmarks.dataset import SCALES
+from benchmarks.runner import DEFAULT_DATABASE, load_dataset
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=DEFAULT_DATABASE.replace('.db', '-serialization.db'))
+    parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+    os.environ['CACHE_BACKEND'] = 'memory'
+    from app import app
+    from models import db, Characters
+    from json_provider import JSON_PROVIDERS, orjson
+    from rowjson import row_encoder
+
+    scale = dict(SCALES['small'], characters=args.rows)
+    load_dataset(app, args.database, scale, args.seed, False, lambda message: print(message, file=sys.stderr))
+
+    providers = {name: provider(app) for name, provider in JSON_PROVIDERS.items()
+                 if name != 'orjson' or orjson is not None}
+    encoder = row_encoder(Characters, ensure_ascii=app.json.ensure_ascii)
+    columns = [getattr(Characters, name) for name in encoder.columns]
+
+    def orm_serialize(provider):
+        def run():
+            characters = db.session.execute(db.select(Characters)).scalars().all()
+            body = provider.response([character.serialize() for character in characters]).get_data()
+            # Each run starts from an empty identity map, as a request would
+            db.session.expunge_all()
+            return body
+        return run
+
+    def row_tuples():
+        rows = db.session.execute(db.select(*columns)).all()
+        return encoder.array(rows).encode()
+
+    cases = {f'orm + serialize() + {name}': orm_serialize(provider) for name, provider in providers.items()}
+    cases['row tuples + row encoder'] = row_tuples
+
+    results = []
+    with app.app_context():
+        for name, function in cases.items():
+            seconds, size = timed(function, args.repeat)
+            results.append({'case': name, 'rows': args.rows, 'seconds': round(seconds, 4),
+                            'rows_per_second': round(args.rows / seconds), 'bytes': size})
+    baseline = results[0]['seconds']
+    for result in results:
+        result['speedup'] = round(baseline / result['seconds'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
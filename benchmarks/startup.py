@@ -0,0 +1,101 @@
+"""
+Cold start of the app, each run in a fresh interpreter: the time to import
+it, the slowest of its direct imports per `python -X importtime`, and a
+check that the lazily loaded subsystems stay out of the import:
+
+    python -m benchmarks.startup --runs 5 --max-ms 800
+
+Exits with status 1 when a lazy module is imported at startup or the median
+import time is over --max-ms, so it can guard against regressions in CI.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from benchmarks import SRC
+
+# Only imported once the route or command that needs them runs
+LAZY_MODULES = ('numpy', 'scipy', 'alembic', 'flask_migrate', 'flask_swagger')
+IMPORT_APP = 'import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)'
+# name: environment on top of the current one
+SCENARIOS = {
+    'server': {},
+    'server without admin': {'ADMIN_ENABLED': '0'},
+}
+
+
+def parse_importtime(output):
+    """{module: cumulative microseconds} for every module, and the ones the
+    app module imported directly"""
+    modules = {}
+    children = []
+    app_children = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # One space, then two more per level of nesting. Children are
+        # printed before the module that imported them.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules[name] = int(cumulative)
+        if depth == 1:
+            children.append(name)
+        elif depth == 0:
+            if name == 'app':
+                app_children = children
+            children = []
+    return modules, app_children
+
+
+def import_once(environment):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_APP], cwd=SRC,
+                            env=environment, capture_output=True, text=True, check=True)
+    seconds = float(result.stdout.strip().splitlines()[-1])
+    modules, app_children = parse_importtime(result.stderr)
+    return seconds, modules, app_children
+
+
+def run_scenario(extra, runs, top):
+    environment = dict(os.environ, **extra)
+    # Importing never connects, but keep it away from any real database
+    environment.setdefault('DATABASE_URL', 'sqlite:////tmp/starwars-startup.db')
+    timings = []
+    for _ in range(runs):
+        seconds, modules, app_children = import_once(environment)
+        timings.append(seconds)
+    slowest = sorted(app_children, key=lambda name: -modules[name])[:top]
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'min_ms': round(min(timings) * 1000, 1),
+        'slowest_imports_ms': {name: round(modules[name] / 1000, 1) for name in slowest},
+        'lazy_modules_imported': [name for name in LAZY_MODULES if name in modules],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='How many of the slowest imports to list')
+    parser.add_argument('--max-ms', type=float, help='Fail when the median import time is above this')
+    args = parser.parse_args()
+
+    results = {name: run_scenario(extra, args.runs, args.top) for name, extra in SCENARIOS.items()}
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    for name, result in results.items():
+        if result['lazy_modules_imported']:
+            failures.append(f"{name}: imports {', '.join(result['lazy_modules_imported'])} at startup")
+        if args.max_ms is not None and result['median_ms'] > args.max_ms:
+            failures.append(f"{name}: median import {result['median_ms']}ms is over {args.max_ms}ms")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""
+gunicorn settings, picked up because the Procfile and render.yaml start
+gunicorn from the repository root. Command line options still win.
+
+GUNICORN_PRELOAD=1 imports the app once in the master and forks the workers
+from it: they start instantly and share the imported modules' memory.
+Anything holding connections or threads resets itself in the child, see
+dispose_after_fork() in pool.py.
+"""
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '0').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,104 @@
+"""tables for characters, planets, vehicles and favorites
+
+Revision ID: 1d6e0b7c9a42
+Revises: a5cffa318ac2
+Create Date: 2026-10-18 14:48:30.612904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d6e0b7c9a42'
+down_revision = 'a5cffa318ac2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The first revision's user table (id, is_active) never matched the
+    # model, the app could not read or write it, so it is replaced
+    op.drop_table('user')
+    op.create_table('user',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password', sa.String(), nullable=False),
+    sa.Column('username', sa.String(length=30), nullable=False),
+    sa.Column('first_name', sa.String(length=20), nullable=False),
+    sa.Column('last_name', sa.String(length=20), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('characters',
+    sa.Column('character_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('gender', sa.String(length=10), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.Column('birthdate', sa.String(length=20), nullable=False),
+    sa.PrimaryKeyConstraint('character_id')
+    )
+    op.create_table('planets',
+    sa.Column('planet_id', sa.Integer(), nullable=False),
+    sa.Column('planet_name', sa.String(length=20), nullable=False),
+    sa.Column('climate', sa.String(length=20), nullable=False),
+    sa.Column('terrain', sa.String(length=20), nullable=False),
+    sa.Column('day_length_hours', sa.Integer(), nullable=False),
+    sa.Column('year_length_days', sa.Integer(), nullable=False),
+    sa.Column('population', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('planet_id')
+    )
+    op.create_table('vehicles',
+    sa.Column('vehicle_id', sa.Integer(), nullable=False),
+    sa.Column('vehicle_name', sa.String(length=40), nullable=False),
+    sa.Column('cargo_capacity', sa.Float(), nullable=False),
+    sa.Column('number_passengers', sa.Integer(), nullable=False),
+    sa.Column('number_crew', sa.Integer(), nullable=False),
+    sa.Column('model', sa.String(length=40), nullable=False),
+    sa.Column('cost', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('vehicle_id')
+    )
+    op.create_table('favoritecharacters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('character_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['character_id'], ['characters.character_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('favoriteplanets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('planet_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['planet_id'], ['planets.planet_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('favoritevehicles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('vehicle_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ),
+    sa.ForeignKeyConstraint(['vehicle_id'], ['vehicles.vehicle_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('favoritevehicles')
+    op.drop_table('favoriteplanets')
+    op.drop_table('favoritecharacters')
+    op.drop_table('vehicles')
+    op.drop_table('planets')
+    op.drop_table('characters')
+    op.drop_table('user')
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password', sa.String(length=80), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
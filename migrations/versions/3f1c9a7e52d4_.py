@@ -0,0 +1,40 @@
+"""unique favorite per user and target
+
+Revision ID: 3f1c9a7e52d4
+Revises: 1d6e0b7c9a42
+Create Date: 2026-10-18 15:02:11.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7e52d4'
+down_revision = '1d6e0b7c9a42'
+branch_labels = None
+depends_on = None
+
+FAVORITE_TABLES = [
+    ('favoritecharacters', 'character_id'),
+    ('favoriteplanets', 'planet_id'),
+    ('favoritevehicles', 'vehicle_id'),
+]
+
+
+def upgrade():
+    for table, column in FAVORITE_TABLES:
+        # Drop duplicates left behind by the old check-then-insert routes
+        op.execute(
+            f'DELETE FROM {table} WHERE id NOT IN ('
+            f'SELECT id FROM (SELECT MIN(id) AS id FROM {table} '
+            f'GROUP BY user_id, {column}) AS keep)')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{table}_user_id_{column}',
+                                  ['user_id', column], unique=True)
+
+
+def downgrade():
+    for table, column in reversed(FAVORITE_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_user_id_{column}')
@@ -0,0 +1,33 @@
+"""per-table version counters for conditional GETs
+
+Revision ID: 8b2d4e6f1a93
+Revises: 3f1c9a7e52d4
+Create Date: 2026-10-18 15:31:47.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a93'
+down_revision = '3f1c9a7e52d4'
+branch_labels = None
+depends_on = None
+
+VERSIONED_TABLES = ['user', 'characters', 'planets', 'vehicles',
+                    'favoritecharacters', 'favoriteplanets', 'favoritevehicles']
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=40), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_version, [{'table_name': table, 'version': 0}
+                                   for table in VERSIONED_TABLES])
+
+
+def downgrade():
+    op.drop_table('table_version')
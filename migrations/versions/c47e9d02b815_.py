@@ -0,0 +1,40 @@
+"""indexes for filterable and sortable list columns
+
+Revision ID: c47e9d02b815
+Revises: 8b2d4e6f1a93
+Create Date: 2026-10-18 16:05:23.550914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e9d02b815'
+down_revision = '8b2d4e6f1a93'
+branch_labels = None
+depends_on = None
+
+# Each index is (column, primary key) so a filtered, sorted page is a seek
+FILTER_INDEXES = {
+    'user': ('user_id', ['last_name']),
+    'characters': ('character_id', ['name', 'gender', 'height', 'weight']),
+    'planets': ('planet_id', ['planet_name', 'climate', 'terrain', 'population',
+                              'day_length_hours', 'year_length_days']),
+    'vehicles': ('vehicle_id', ['vehicle_name', 'model', 'cost', 'cargo_capacity',
+                                'number_passengers', 'number_crew']),
+}
+
+
+def upgrade():
+    for table, (pk, columns) in FILTER_INDEXES.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.create_index(f'ix_{table}_{column}', [column, pk], unique=False)
+
+
+def downgrade():
+    for table, (pk, columns) in FILTER_INDEXES.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.drop_index(f'ix_{table}_{column}')
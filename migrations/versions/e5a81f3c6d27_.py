@@ -0,0 +1,85 @@
+"""full text search index for characters, planets and vehicles
+
+Revision ID: e5a81f3c6d27
+Revises: c47e9d02b815
+Create Date: 2026-10-18 16:41:09.273560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a81f3c6d27'
+down_revision = 'c47e9d02b815'
+branch_labels = None
+depends_on = None
+
+# kind, table, primary key, rowid code, title, details, columns the index reads.
+# The DDL is spelled out here rather than imported from search.py so this
+# revision keeps creating the same schema whatever the app code becomes.
+SEARCHABLE = [
+    ('people', 'characters', 'character_id', 1, "coalesce({0}name, '')", "''",
+     ['character_id', 'name']),
+    ('planets', 'planets', 'planet_id', 2, "coalesce({0}planet_name, '')",
+     "coalesce({0}climate, '') || ' ' || coalesce({0}terrain, '')",
+     ['planet_id', 'planet_name', 'climate', 'terrain']),
+    ('vehicles', 'vehicles', 'vehicle_id', 3, "coalesce({0}vehicle_name, '')",
+     "coalesce({0}model, '')", ['vehicle_id', 'vehicle_name', 'model']),
+]
+
+
+def sqlite_upgrade():
+    # One FTS5 table for every kind, kept in sync by triggers. The rowid packs
+    # kind and id together so a trigger replaces a row by rowid.
+    op.execute("CREATE VIRTUAL TABLE search_index USING fts5("
+               "kind UNINDEXED, entity_id UNINDEXED, title, details, "
+               "tokenize='unicode61 remove_diacritics 2')")
+    for kind, table, pk, code, title, details, columns in SEARCHABLE:
+        insert = (f"INSERT INTO search_index (rowid, kind, entity_id, title, details) "
+                  f"VALUES (new.{pk} * 4 + {code}, '{kind}', new.{pk}, "
+                  f"{title.format('new.')}, {details.format('new.')});")
+        delete = f"DELETE FROM search_index WHERE rowid = old.{pk} * 4 + {code};"
+        op.execute(f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} "
+                   f"BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER {table}_search_update "
+                   f"AFTER UPDATE OF {', '.join(columns)} ON {table} "
+                   f"BEGIN {delete} {insert} END")
+        op.execute(f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} "
+                   f"BEGIN {delete} END")
+        op.execute(f"INSERT INTO search_index (rowid, kind, entity_id, title, details) "
+                   f"SELECT {pk} * 4 + {code}, '{kind}', {pk}, {title.format('')}, "
+                   f"{details.format('')} FROM {table}")
+
+
+def postgresql_upgrade():
+    for kind, table, pk, code, title, details, columns in SEARCHABLE:
+        vector = (f"setweight(to_tsvector('simple', {title.format('')}), 'A') || "
+                  f"setweight(to_tsvector('simple', {details.format('')}), 'B')")
+        op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                   f"GENERATED ALWAYS AS ({vector}) STORED")
+        op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} "
+                   f"USING GIN (search_vector)")
+
+
+def upgrade():
+    # SQLite gets an FTS5 table kept in sync by triggers, Postgres gets
+    # generated tsvector columns with GIN indexes
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        sqlite_upgrade()
+    elif dialect == 'postgresql':
+        postgresql_upgrade()
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for kind, table, pk, code, title, details, columns in SEARCHABLE:
+        if dialect == 'sqlite':
+            for operation in ('insert', 'update', 'delete'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_search_{operation}')
+        elif dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_search_vector')
+            op.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_index')
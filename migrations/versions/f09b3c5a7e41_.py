@@ -0,0 +1,39 @@
+"""denormalized favorite counters
+
+Revision ID: f09b3c5a7e41
+Revises: e5a81f3c6d27
+Create Date: 2026-10-18 17:12:38.905417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f09b3c5a7e41'
+down_revision = 'e5a81f3c6d27'
+branch_labels = None
+depends_on = None
+
+COUNTED_TABLES = [
+    ('characters', 'character_id', 'favoritecharacters'),
+    ('planets', 'planet_id', 'favoriteplanets'),
+    ('vehicles', 'vehicle_id', 'favoritevehicles'),
+]
+
+
+def upgrade():
+    for table, pk, favorites in COUNTED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('favorite_count', sa.Integer(),
+                                          server_default='0', nullable=False))
+            batch_op.create_index(f'ix_{table}_favorite_count', ['favorite_count', pk], unique=False)
+        op.execute(f'UPDATE {table} SET favorite_count = (SELECT COUNT(*) FROM {favorites} '
+                   f'WHERE {favorites}.{pk} = {table}.{pk})')
+
+
+def downgrade():
+    for table, pk, favorites in COUNTED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_favorite_count')
+            batch_op.drop_column('favorite_count')
@@ -1,7 +1,7 @@
-import os
 from flask_admin import Admin
 from models import db, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
 from flask_admin.contrib.sqla import ModelView
+from auth import hash_password, is_password_hash
 
 
 class UserModelView(ModelView):
@@ -9,6 +9,11 @@ class UserModelView(ModelView):
     column_list = ['user_id', 'email', 'password', 'username', 'first_name',
                    'last_name', 'favorite_characters', 'favorite_planets', 'favorite_vehicles']
 
+    def on_model_change(self, form, model, is_created):
+        # A password typed in the form is stored hashed like everywhere else
+        if not is_password_hash(model.password):
+            model.password = hash_password(model.password)
+
 
 class CharactersModelView(ModelView):
     column_auto_select_related = True
@@ -44,7 +49,6 @@ class FavoriteVehiclesModelView(ModelView):
 
 
 def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
@@ -2,17 +2,36 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import json
+import click
+from flask import Flask, Response, request, jsonify, url_for, stream_with_context, g
 from flask_cors import CORS
 from utils import APIException, generate_sitemap
-from admin import setup_admin
+from pagination import paginate
+from rowjson import row_encoder, json_response
+from json_provider import make_json_provider
+from fieldsets import get_fields, project
+from rows import fetch_rows
+from streaming import wants_stream, stream_collection
+from bulk import bulk_insert, USER_FIELDS, CHARACTER_FIELDS, PLANET_FIELDS, VEHICLE_FIELDS
+from versions import conditional
+from cache import entity_cache, get_serialized
+from pool import engine_options, pool_metrics, dispose_after_fork
+from metrics import setup_metrics, request_metrics, PROMETHEUS_MIMETYPE
+from compress import setup_compression, compressed_bodies
+from auth import setup_auth, auth_required, hash_password, hash_passwords, is_password_hash, verify_password, issue_token, revoked_tokens, TOKEN_TTL
+from search import search, get_search_args
+from recommendations import related_items, related_versions, RELATED_TOP_K
+from favorites import add_favorite, remove_favorite, apply_favorite_batch, leaderboard, favorite_targets, reconcile_favorite_counts, FAVORITE_KINDS, EXISTS, MISSING_USER, MISSING_TARGET, NOT_FOUND
+from export import export_table, export_file, export_filename, get_export_args, EXPORT_MODELS, EXPORT_FORMATS, EXPORT_COMPRESSIONS
+from importer import import_file, guess_format, IMPORT_KINDS, IMPORT_FORMATS, IMPORT_BATCH_SIZE
+from startup import setup_migrate, ADMIN_ENABLED
 from models import db, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
 # from models import Person
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+app.json = make_json_provider(app)
 
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -21,11 +40,20 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
-MIGRATE = Migrate(app, db)
+app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+
+setup_migrate(app, db)
 db.init_app(app)
+dispose_after_fork(app, db)
 CORS(app)
-setup_admin(app)
+if ADMIN_ENABLED:
+    from admin import setup_admin
+    setup_admin(app)
+setup_metrics(app)
+setup_auth(app)
+setup_compression(app)
 
 # Handle/serialize errors like a JSON object
 
@@ -51,26 +79,86 @@ def handle_hello():
 
     return jsonify(response_body), 200
 
+
+@app.route('/internal/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(entity_cache.stats()), 200
+
+
+@app.route('/internal/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(pool_metrics.stats(db.engine.pool)), 200
+
+
+@app.route('/internal/compression', methods=['GET'])
+def compression_stats():
+    return jsonify(compressed_bodies.stats()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(request_metrics.export(), content_type=PROMETHEUS_MIMETYPE)
+
+#                                                                       //-----Auth-----//
+
+@app.route('/login', methods=['POST'])
+def login():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or 'password' not in body:
+        return jsonify({'msg': 'Email or username and password are required'}), 400
+    if 'email' in body:
+        condition = User.email == body['email']
+    elif 'username' in body:
+        condition = User.username == body['username']
+    else:
+        return jsonify({'msg': 'Email or username and password are required'}), 400
+    user = db.session.execute(db.select(User.user_id, User.password).where(condition)).first()
+    # Verified even for unknown users so both answers take as long
+    if not verify_password(user.password if user else None, str(body['password'])):
+        return jsonify({'msg': 'Invalid credentials'}), 401
+    return jsonify({'token': issue_token(user.user_id),
+                    'expires_in': TOKEN_TTL, 'user_id': user.user_id}), 200
+
+
+@app.route('/logout', methods=['POST'])
+@auth_required
+def logout():
+    revoked_tokens.revoke(g.token_id, g.token_expires)
+    return jsonify({'msg': 'Logged out'}), 200
+
+
+@app.cli.command('hash-passwords')
+def hash_stored_passwords():
+    """Replace passwords still stored as plain text with their hash."""
+    users = db.session.execute(db.select(User.user_id, User.password)).all()
+    plain = [user for user in users if not is_password_hash(user.password)]
+    hashed = hash_passwords([user.password for user in plain])
+    if plain:
+        db.session.execute(db.update(User), [{'user_id': user.user_id, 'password': password}
+                                             for user, password in zip(plain, hashed)])
+        db.session.commit()
+    print(f'{len(plain)} passwords hashed')
+
+
 #                                                                       //-----User Routes-----//
 
 
 @app.route('/users', methods=['GET'])
+@conditional('user')
 def get_users():
-    users = User.query.all()
-    users_serialized = []
-    for user in users:
-        users_serialized.append(user.serialize())
-
-    return jsonify({'users': users_serialized}), 200
+    if wants_stream():
+        return stream_collection(User, User.user_id, 'users')
+    encoder = row_encoder(User, get_fields(User))
+    users, next_cursor = paginate(User, User.user_id, encoder.columns)
+    return json_response(users=encoder.array(users), next=json.dumps(next_cursor)), 200
 
 
 @app.route('/users/<int:id>', methods=['GET'])
+@conditional('user')
 def get_user(id):
-    user = User.query.get(id)
-    if user == None:
+    serialized_user = get_serialized(User, id, get_fields(User))
+    if serialized_user == None:
         return jsonify({'msg': 'User does not exist'})
-    else:
-        serialized_user = user.serialize()
     return jsonify({'data': serialized_user}), 200
 
 
@@ -91,16 +179,27 @@ def add_user():
         return jsonify({'msg': 'Last name is required'})
 
     new_user = User()
-    new_user.email = body['email'],
-    new_user.password = body['password'],
-    new_user.username = body['username'],
-    new_user.first_name = body['first_name'],
+    new_user.email = body['email']
+    new_user.password = hash_password(body['password'])
+    new_user.username = body['username']
+    new_user.first_name = body['first_name']
     new_user.last_name = body['last_name']
     db.session.add(new_user)
     db.session.commit()
     return jsonify({'msg': 'User added successfully'}), 201
 
 
+@app.route('/users/bulk', methods=['POST'])
+def add_users_bulk():
+    return bulk_insert(User, User.user_id, USER_FIELDS, prepare=hash_user_passwords)
+
+
+def hash_user_passwords(rows):
+    # The whole batch is hashed in parallel on the hashing pool
+    for row, hashed in zip(rows, hash_passwords([row['password'] for row in rows])):
+        row['password'] = hashed
+
+
 @app.route('/users/<int:id>', methods=['PUT'])
 def update_user(id):
     user = User.query.get(id)
@@ -111,7 +210,7 @@ def update_user(id):
     if 'email' in body:
         user.email = body['email']
     if 'password' in body:
-        user.password = body['password']
+        user.password = hash_password(body['password'])
     if 'username' in body:
         user.username = body['username']
     if 'first_name' in body:
@@ -135,25 +234,32 @@ def delete_user(id):
 
 
 @app.route('/people', methods=['GET'])
+@conditional('characters')
 def get_characters():
-    characters = Characters.query.all()
-    characters_serialized = []
-    for character in characters:
-        characters_serialized.append(character.serialize())
-
-    return jsonify({'characters': characters_serialized}), 200
+    if wants_stream():
+        return stream_collection(Characters, Characters.character_id, 'characters')
+    encoder = row_encoder(Characters, get_fields(Characters))
+    characters, next_cursor = paginate(Characters, Characters.character_id, encoder.columns)
+    return json_response(characters=encoder.array(characters), next=json.dumps(next_cursor)), 200
 
 
 @app.route('/people/<int:id>', methods=['GET'])
+@conditional('characters')
 def get_character(id):
-    character = Characters.query.get(id)
-    if character == None:
+    serialized_character = get_serialized(Characters, id, get_fields(Characters))
+    if serialized_character == None:
         return jsonify({'msg': 'character does not exist'})
-    else:
-        serialized_character = character.serialize()
     return jsonify({'data': serialized_character}), 200
 
 
+@app.route('/people/<int:id>/related', methods=['GET'])
+@conditional('favoritecharacters', 'characters', versions=related_versions('people'))
+def get_related_characters(id):
+    top = request.args.get('top', 10, type=int)
+    related = related_items('people', id, max(1, min(top, RELATED_TOP_K)))
+    return jsonify({'related': related}), 200
+
+
 @app.route('/people', methods=['POST'])
 def add_character():
     body = request.get_json(silent=True)
@@ -171,16 +277,21 @@ def add_character():
         body['birthdate'] = 'N/A'
 
     new_character = Characters()
-    new_character.name = body['name'],
-    new_character.gender = body['gender'],
-    new_character.height = body['height'],
-    new_character.weight = body['weight'],
+    new_character.name = body['name']
+    new_character.gender = body['gender']
+    new_character.height = body['height']
+    new_character.weight = body['weight']
     new_character.birthdate = body['birthdate']
     db.session.add(new_character)
     db.session.commit()
     return jsonify({'msg': 'Charcater added succesfully'}), 201
 
 
+@app.route('/people/bulk', methods=['POST'])
+def add_characters_bulk():
+    return bulk_insert(Characters, Characters.character_id, CHARACTER_FIELDS)
+
+
 @app.route('/people/<int:id>', methods=['PUT'])
 def update_character(id):
     character = Characters.query.get(id)
@@ -215,25 +326,33 @@ def delete_character(id):
 
 
 @app.route('/planets', methods=['GET'])
+@conditional('planets')
 def get_planets():
-    planets = Planets.query.all()
-    planets_serialized = []
-    for planet in planets:
-        planets_serialized.append(planet.serialize())
-
-    return jsonify({'planets': planets_serialized}), 200
+    if wants_stream():
+        return stream_collection(Planets, Planets.planet_id, 'planets')
+    encoder = row_encoder(Planets, get_fields(Planets))
+    planets, next_cursor = paginate(Planets, Planets.planet_id, encoder.columns)
+    return json_response(planets=encoder.array(planets), next=json.dumps(next_cursor)), 200
 
 
 @app.route('/planets/<int:id>', methods=['GET'])
+@conditional('planets')
 def get_planet(id):
-    planet = Planets.query.get(id)
-    if planet == None:
+    serialized_planet = get_serialized(Planets, id, get_fields(Planets))
+    if serialized_planet == None:
         return jsonify({'msg': 'Planet does not exist'}), 404
     else:
-        serialized_planet = planet.serialize()
         return jsonify({'data': serialized_planet})
 
 
+@app.route('/planets/<int:id>/related', methods=['GET'])
+@conditional('favoriteplanets', 'planets', versions=related_versions('planets'))
+def get_related_planets(id):
+    top = request.args.get('top', 10, type=int)
+    related = related_items('planets', id, max(1, min(top, RELATED_TOP_K)))
+    return jsonify({'related': related}), 200
+
+
 @app.route('/planets', methods=['POST'])
 def add_planet():
     body = request.get_json(silent=True)
@@ -251,17 +370,22 @@ def add_planet():
         body['population'] = 0
 
     new_planet = Planets()
-    new_planet.planet_name = body['planet_name'],
-    new_planet.climate = body['climate'],
-    new_planet.terrain = body['terrain'],
-    new_planet.day_length_hours = body['day_length_hours'],
-    new_planet.year_length_days = body['year_length_days'],
-    new_planet.population = body['population'],
+    new_planet.planet_name = body['planet_name']
+    new_planet.climate = body['climate']
+    new_planet.terrain = body['terrain']
+    new_planet.day_length_hours = body['day_length_hours']
+    new_planet.year_length_days = body['year_length_days']
+    new_planet.population = body['population']
     db.session.add(new_planet)
     db.session.commit()
     return jsonify({'msg': 'Planet added successfully'}), 201
 
 
+@app.route('/planets/bulk', methods=['POST'])
+def add_planets_bulk():
+    return bulk_insert(Planets, Planets.planet_id, PLANET_FIELDS)
+
+
 @app.route('/planets/<int:id>', methods=['PUT'])
 def update_planet(id):
     planet = Planets.query.get(id)
@@ -298,24 +422,33 @@ def delete_planet(id):
 
 
 @app.route('/vehicles', methods=['GET'])
+@conditional('vehicles')
 def get_vehicles():
-    vehicles = Vehicles.query.all()
-    vehicles_serialized = []
-    for vehicle in vehicles:
-        vehicles_serialized.append(vehicle.serialize())
-    return jsonify({'vehicles': vehicles_serialized}), 200
+    if wants_stream():
+        return stream_collection(Vehicles, Vehicles.vehicle_id, 'vehicles')
+    encoder = row_encoder(Vehicles, get_fields(Vehicles))
+    vehicles, next_cursor = paginate(Vehicles, Vehicles.vehicle_id, encoder.columns)
+    return json_response(vehicles=encoder.array(vehicles), next=json.dumps(next_cursor)), 200
 
 
 @app.route('/vehicles/<int:id>', methods=['GET'])
+@conditional('vehicles')
 def get_vehicle(id):
-    vehicle = Vehicles.query.get(id)
-    if vehicle == None:
+    vehicle_serialized = get_serialized(Vehicles, id, get_fields(Vehicles))
+    if vehicle_serialized == None:
         return jsonify({'msg': 'Vehicle does not exist'}), 404
     else:
-        vehicle_serialized = vehicle.serialize()
         return jsonify({'data': vehicle_serialized})
 
 
+@app.route('/vehicles/<int:id>/related', methods=['GET'])
+@conditional('favoritevehicles', 'vehicles', versions=related_versions('vehicles'))
+def get_related_vehicles(id):
+    top = request.args.get('top', 10, type=int)
+    related = related_items('vehicles', id, max(1, min(top, RELATED_TOP_K)))
+    return jsonify({'related': related}), 200
+
+
 @app.route('/vehicles', methods=['POST'])
 def add_vehicle():
     body = request.get_json(silent=True)
@@ -333,11 +466,11 @@ def add_vehicle():
         body['cost'] = 0
 
     new_vehicle = Vehicles()
-    new_vehicle.vehicle_name = body['vehicle_name'],
-    new_vehicle.cargo_capacity = body['cargo_capacity'],
-    new_vehicle.number_passengers = body['number_passengers'],
-    new_vehicle.number_crew = body['number_crew'],
-    new_vehicle.model = body['model'],
+    new_vehicle.vehicle_name = body['vehicle_name']
+    new_vehicle.cargo_capacity = body['cargo_capacity']
+    new_vehicle.number_passengers = body['number_passengers']
+    new_vehicle.number_crew = body['number_crew']
+    new_vehicle.model = body['model']
     new_vehicle.cost = body['cost']
 
     db.session.add(new_vehicle)
@@ -345,6 +478,11 @@ def add_vehicle():
     return jsonify({'msg': 'Vehicle added successfully'}), 201
 
 
+@app.route('/vehicles/bulk', methods=['POST'])
+def add_vehicles_bulk():
+    return bulk_insert(Vehicles, Vehicles.vehicle_id, VEHICLE_FIELDS)
+
+
 @app.route('/vehicles/<int:id>', methods=['PUT'])
 def update_vehicle(id):
     vehicle = Vehicles.query.get(id)
@@ -378,43 +516,40 @@ def delete_vehicle(id):
     return jsonify({'msg': 'Vehicle deleted successfully'})
 
 
+#                                                                       //-----Search-----//
+
+
+@app.route('/search', methods=['GET'])
+@conditional('characters', 'planets', 'vehicles')
+def search_entities():
+    q, limit = get_search_args()
+    return jsonify({'results': search(q, limit)}), 200
+
+
 #                                                                       //-----Favorite Characters-----//
 
 
 @app.route('/favorite/people/<int:people_id>/user/<int:user_id>', methods=['POST'])
 def add_favorite_character(user_id, people_id):
-    user = User.query.get(user_id)
-    character = Characters.query.get(people_id)
-    if user is None:
+    status = add_favorite(FavoriteCharacters, Characters, user_id, people_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if character is None:
+    if status == MISSING_TARGET:
         return jsonify({'msg': 'Character doesnt exist'}), 404
-    favorites = FavoriteCharacters.query.filter_by(
-        user_id=user_id, character_id=people_id).all()
-    if len(favorites) > 0:
+    if status == EXISTS:
         return jsonify({'msg': 'Favorite already exists'})
-    new_favorite = FavoriteCharacters()
-    new_favorite.user_id = user_id
-    new_favorite.character_id = people_id
-    db.session.add(new_favorite)
-    db.session.commit()
     return jsonify({'msg': 'Favorite character added'})
 
 
 @app.route('/favorite/people/<int:people_id>/user/<int:user_id>', methods=['DELETE'])
 def delete_favorite_character(people_id, user_id):
-    user = User.query.get(user_id)
-    character = Characters.query.get(people_id)
-    if user is None:
+    status = remove_favorite(FavoriteCharacters, Characters, user_id, people_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if character is None:
+    if status == MISSING_TARGET:
         return jsonify({'msg': 'Character doesnt exist'}), 404
-    favorites = FavoriteCharacters.query.filter_by(
-        character_id=people_id, user_id=user_id).all()
-    if len(favorites) == 0:
+    if status == NOT_FOUND:
         return jsonify({'msg': 'Favorite doesnt exist'})
-    db.session.delete(favorites[0])
-    db.session.commit()
     return jsonify({'msg': 'Favorite character deleted successfully'})
 
 
@@ -422,38 +557,25 @@ def delete_favorite_character(people_id, user_id):
 
 @app.route('/favorite/planets/<int:planet_id>/user/<int:user_id>', methods=['POST'])
 def add_favorite_planet(user_id, planet_id):
-    user = User.query.get(user_id)
-    planet = Characters.query.get(planet_id)
-    if user is None:
+    status = add_favorite(FavoritePlanets, Planets, user_id, planet_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if planet is None:
-        return jsonify({'msg': 'Character doesnt exist'}), 404
-    favorites = FavoritePlanets.query.filter_by(
-        user_id=user_id, planet_id=planet_id).all()
-    if len(favorites) > 0:
+    if status == MISSING_TARGET:
+        return jsonify({'msg': 'Planet doesnt exist'}), 404
+    if status == EXISTS:
         return jsonify({'msg': 'Favorite already exists'})
-    new_favorite = FavoritePlanets()
-    new_favorite.user_id = user_id
-    new_favorite.planet_id = planet_id
-    db.session.add(new_favorite)
-    db.session.commit()
     return jsonify({'msg': 'Favorite planet added'})
 
 
 @app.route('/favorite/planets/<int:planet_id>/user/<int:user_id>', methods=['DELETE'])
 def delete_favorite_planet(planet_id, user_id):
-    user = User.query.get(user_id)
-    planet = Planets.query.get(planet_id)
-    if user is None:
+    status = remove_favorite(FavoritePlanets, Planets, user_id, planet_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if planet is None:
-        return jsonify({'msg': 'planet doesnt exist'}), 404
-    favorites = FavoritePlanets.query.filter_by(
-        planet_id=planet_id, user_id=user_id).all()
-    if len(favorites) == 0:
+    if status == MISSING_TARGET:
+        return jsonify({'msg': 'Planet doesnt exist'}), 404
+    if status == NOT_FOUND:
         return jsonify({'msg': 'Favorite does not exist'}), 404
-    db.session.delete(favorites[0])
-    db.session.commit()
     return jsonify({'msg': 'Favorite planet deleted successfully'})
 
 
@@ -461,59 +583,124 @@ def delete_favorite_planet(planet_id, user_id):
 
 @app.route('/favorite/vehicles/<int:vehicle_id>/user/<int:user_id>', methods=['POST'])
 def add_favorite_vehicle(user_id, vehicle_id):
-    user = User.query.get(user_id)
-    vehicle = Characters.query.get(vehicle_id)
-    if user is None:
+    status = add_favorite(FavoriteVehicles, Vehicles, user_id, vehicle_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if vehicle is None:
+    if status == MISSING_TARGET:
         return jsonify({'msg': 'Vehicle doesnt exist'}), 404
-    favorites = FavoriteVehicles.query.filter_by(
-        user_id=user_id, vehicle_id=vehicle_id).all()
-    print(favorites)
-    if len(favorites) > 0:
+    if status == EXISTS:
         return jsonify({'msg': 'Favorite already exists'})
-
-    new_favorite = FavoriteVehicles()
-    new_favorite.user_id = user_id
-    new_favorite.vehicle_id = vehicle_id
-    db.session.add(new_favorite)
-    db.session.commit()
     return jsonify({'msg': 'Favorite vehicle added'})
 
 
 @app.route('/favorite/vehicles/<int:vehicle_id>/user/<int:user_id>', methods=['DELETE'])
 def delete_favorite_vehicle(vehicle_id, user_id):
-    user = User.query.get(user_id)
-    vehicle = Vehicles.query.get(vehicle_id)
-    if user is None:
+    status = remove_favorite(FavoriteVehicles, Vehicles, user_id, vehicle_id)
+    if status == MISSING_USER:
         return jsonify({'msg': 'User doesnt exist'}), 404
-    if vehicle is None:
-        return jsonify({'msg': 'vehicle doesnt exist'}), 404
-    favorites = FavoriteVehicles.query.filter_by(
-        vehicle_id=vehicle_id, user_id=user_id).all()
-    if len(favorites) == 0:
+    if status == MISSING_TARGET:
+        return jsonify({'msg': 'Vehicle doesnt exist'}), 404
+    if status == NOT_FOUND:
         return jsonify({'msg': 'Favorite doesnt exist'})
-    db.session.delete(favorites[0])
-    db.session.commit()
     return jsonify({'msg': 'Favorite vehicle deleted successfully'})
 
 
+#                                                                       //-----Batch favorites-----//
+
+@app.route('/favorites/batch', methods=['POST'])
+def batch_favorites():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('operations'), list):
+        return jsonify({'msg': 'You must send a list of operations'}), 400
+    results = apply_favorite_batch(body['operations'])
+    return jsonify({'results': results}), 200
+
+
+#                                                                       //-----Leaderboard-----//
+
+@app.route('/leaderboard/<kind>', methods=['GET'])
+@conditional('favoritecharacters', 'favoriteplanets', 'favoritevehicles',
+             'characters', 'planets', 'vehicles')
+def get_leaderboard(kind):
+    if kind not in FAVORITE_KINDS:
+        return jsonify({'msg': 'Leaderboard not found'}), 404
+    top = request.args.get('top', 10, type=int)
+    top = max(1, min(top, 100))
+    return jsonify({'leaderboard': leaderboard(kind, top)}), 200
+
+
+@app.cli.command('reconcile-favorites')
+def reconcile_favorites():
+    """Rebuild the favorite counters from the favorite tables."""
+    reconcile_favorite_counts()
+    print('Favorite counts rebuilt')
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', type=click.Choice(IMPORT_FORMATS),
+              help='File format, guessed from the extension by default.')
+@click.option('--upsert', is_flag=True,
+              help='Update rows whose name already exists instead of adding duplicates.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def import_data(kind, path, format, upsert, batch_size):
+    """Import SWAPI style people, planets or vehicles from JSON, NDJSON or CSV."""
+    # newline='' so the csv module sees quoted line breaks as they are
+    file = click.get_text_stream('stdin') if path == '-' else open(path, encoding='utf-8', newline='')
+    with file:
+        try:
+            summary = import_file(kind, file, format or guess_format(path), upsert, max(1, batch_size),
+                                  progress=lambda message: click.echo(message, err=True))
+        except ValueError as error:
+            raise click.ClickException(str(error))
+    print('{read} rows read, {inserted} inserted, {updated} updated, {skipped} skipped, '
+          '{truncated} truncated in {seconds}s ({rows_per_second} rows/s)'.format(**summary))
+
+
+#                                                                       //-----Export-----//
+
+@app.route('/export/<table>', methods=['GET'])
+def export(table):
+    table, format, compression = get_export_args(
+        table, request.args.get('format', 'ndjson'), request.args.get('compression', 'none'))
+    mimetype = 'application/gzip' if compression == 'gzip' else EXPORT_FORMATS[format][0]
+    response = Response(stream_with_context(export_table(table, format, compression)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=' + export_filename(table, format, compression)
+    return response
+
+
+@app.cli.command('export')
+@click.argument('tables', nargs=-1, type=click.Choice(list(EXPORT_MODELS)))
+@click.option('--format', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--compression', type=click.Choice(EXPORT_COMPRESSIONS), default='none', show_default=True)
+@click.option('--output-dir', type=click.Path(file_okay=False), default='.', show_default=True)
+def export_data(tables, format, compression, output_dir):
+    """Write every table, or the TABLES given, to files in the output directory."""
+    os.makedirs(output_dir, exist_ok=True)
+    for table in tables or EXPORT_MODELS:
+        path = os.path.join(output_dir, export_filename(table, format, compression))
+        summary = export_file(table, path, format, compression)
+        print('{}: {rows} rows to {} in {seconds}s ({rows_per_second} rows/s)'.format(table, path, **summary))
+
+
 #                                                                       //-----All favorites-----//
 
 @app.route('/users/<int:user_id>/favorites', methods=['GET'])
+@conditional('user', 'favoritecharacters', 'favoriteplanets', 'favoritevehicles',
+             'characters', 'planets', 'vehicles')
 def get_favorites(user_id):
-    user = User.query.get(user_id)
-    if user is None:
+    # Plain rows of the targets joined to the favorite tables, four queries
+    # in all and no ORM instances
+    fields = get_fields(Characters, Planets, Vehicles)
+    if db.session.execute(db.select(User.user_id).where(User.user_id == user_id)).first() is None:
         return jsonify({'msg': 'User not found'}), 404
-    favorite_characters_serialized = []
-    for favorite in user.favorite_characters:
-        favorite_characters_serialized.append(favorite.character.serialize())
-    favorite_planets_serialized = []
-    for favorite in user.favorite_planets:
-        favorite_planets_serialized.append(favorite.planet.serialize())
-    favorite_vehicles_serialized = []
-    for favorite in user.favorite_vehicles:
-        favorite_vehicles_serialized.append(favorite.vehicle.serialize())
+    favorite_characters_serialized = [project(row.serialize(), Characters, fields) for row in
+                                      fetch_rows(favorite_targets('people', user_id), Characters)]
+    favorite_planets_serialized = [project(row.serialize(), Planets, fields) for row in
+                                   fetch_rows(favorite_targets('planets', user_id), Planets)]
+    favorite_vehicles_serialized = [project(row.serialize(), Vehicles, fields) for row in
+                                    fetch_rows(favorite_targets('vehicles', user_id), Vehicles)]
     return jsonify({'favorite_characters': favorite_characters_serialized,
                    'favorite_planets': favorite_planets_serialized,
                     'favorite_vehicles': favorite_vehicles_serialized}), 200
@@ -0,0 +1,298 @@
+"""
+ASGI entry point, run it with an ASGI server such as uvicorn:
+
+    uvicorn asgi:application --app-dir ./src/ --workers 4
+
+The collection, detail and favorites reads and /login are answered by async
+handlers on an async engine (aiosqlite locally, asyncpg on Postgres) so a slow query only parks a
+coroutine. Any request those handlers don't cover falls through to the
+regular Flask app, so every route keeps working.
+"""
+import re
+import json
+import asyncio
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.http import parse_etags
+from app import app
+from models import db, TableVersion, User, Characters, Planets, Vehicles
+from pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from versions import etag_for
+from cache import entity_cache
+from compress import negotiate, compress_body, COMPRESSION_MIN_SIZE
+from favorites import favorite_targets, FAVORITE_KINDS
+from rows import select_rows, make_rows
+from rowjson import row_encoder, json_object
+from pool import engine_options
+from auth import verify_password_async, verify_token, bearer_token, issue_token, AUTH_REQUIRED, TOKEN_SECRET, TOKEN_TTL
+from utils import APIException
+
+ASYNC_DRIVERS = {
+    'sqlite://': 'sqlite+aiosqlite://',
+    'postgresql://': 'postgresql+asyncpg://',
+}
+
+# path: (model, response key, tables the ETag depends on)
+COLLECTIONS = {
+    '/users': (User, 'users', ('user',)),
+    '/people': (Characters, 'characters', ('characters',)),
+    '/planets': (Planets, 'planets', ('planets',)),
+    '/vehicles': (Vehicles, 'vehicles', ('vehicles',)),
+}
+# path prefix: (model, not found message, not found status) as in app.py
+DETAILS = {
+    'users': (User, 'User does not exist', 200),
+    'people': (Characters, 'character does not exist', 200),
+    'planets': (Planets, 'Planet does not exist', 404),
+    'vehicles': (Vehicles, 'Vehicle does not exist', 404),
+}
+FAVORITE_TABLES = ('user', 'favoritecharacters', 'favoriteplanets', 'favoritevehicles',
+                   'characters', 'planets', 'vehicles')
+# response key: favorite kind
+FAVORITE_KEYS = {
+    'favorite_characters': 'people',
+    'favorite_planets': 'planets',
+    'favorite_vehicles': 'vehicles',
+}
+DETAIL_PATH = re.compile(r'^/(users|people|planets|vehicles)/(\d+)$')
+FAVORITES_PATH = re.compile(r'^/users/(\d+)/favorites$')
+
+
+def async_database_url(url):
+    for prefix, async_prefix in ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+database_url = async_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+# Same pool sizing as the sync engine, the async drivers need their own pool class
+pool_options = {option: value for option, value in engine_options(database_url).items()
+                if option != 'poolclass'}
+engine = create_async_engine(database_url, **pool_options)
+AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
+wsgi_application = WsgiToAsgi(app)
+
+
+async def current_versions(session, tables):
+    stmt = db.select(TableVersion.table_name, TableVersion.version).where(
+        TableVersion.table_name.in_(tables))
+    versions = dict((await session.execute(stmt)).all())
+    return [versions.get(table, 0) for table in tables]
+
+
+def json_body(payload):
+    return app.json.response(payload).get_data()
+
+
+async def run_blocking(function, *args):
+    # The SQLite and Redis cache backends wait on I/O, so they run on the
+    # default executor rather than holding up the event loop
+    if entity_cache.name == 'memory':
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def list_collection(session, model, key, args):
+    pk = inspect(model).primary_key[0]
+    limit = min(int(args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    if limit < 1:
+        raise APIException('Limit must be greater than 0', status_code=400)
+    # The same row encoder as the Flask route, so both answer with the same bytes
+    encoder = row_encoder(model, ensure_ascii=app.json.ensure_ascii)
+    stmt = select_rows(model).order_by(pk).limit(limit + 1)
+    if 'cursor' in args:
+        after = decode_cursor(args['cursor'])
+        if len(after) != 1:
+            raise APIException('Invalid cursor', status_code=400)
+        stmt = stmt.where(pk > after[0])
+    rows = (await session.execute(stmt)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][encoder.columns.index(pk.key)]])
+    return 200, (json_object(**{key: encoder.array(rows), 'next': json.dumps(next_cursor)}) + '\n').encode()
+
+
+async def get_detail(session, model, id, missing_msg, missing_status):
+    key = (model.__tablename__, id)
+    payload = await run_blocking(entity_cache.get, key)
+    if payload is None:
+        generation = await run_blocking(entity_cache.generation, key[0])
+        pk = inspect(model).primary_key[0]
+        rows = make_rows(await session.execute(select_rows(model).where(pk == id)), model)
+        if not rows:
+            return missing_status, json_body({'msg': missing_msg})
+        payload = rows[0].serialize()
+        await run_blocking(entity_cache.set, key, payload, generation)
+    return 200, json_body({'data': payload})
+
+
+async def get_favorites(session, user_id):
+    stmt = db.select(User.user_id).where(User.user_id == user_id)
+    if (await session.execute(stmt)).first() is None:
+        return 404, json_body({'msg': 'User not found'})
+    payload = {}
+    for key, kind in FAVORITE_KEYS.items():
+        target = FAVORITE_KINDS[kind][1]
+        rows = make_rows(await session.execute(favorite_targets(kind, user_id)), target)
+        payload[key] = [row.serialize() for row in rows]
+    return 200, json_body(payload)
+
+
+def match_route(path, args):
+    """Async handler and ETag tables for a request, or None to use Flask"""
+    if path in COLLECTIONS and set(args) <= {'limit', 'cursor'}:
+        model, key, tables = COLLECTIONS[path]
+        return (lambda session: list_collection(session, model, key, args)), tables
+    if args:
+        return None
+    match = DETAIL_PATH.match(path)
+    if match:
+        model, missing_msg, missing_status = DETAILS[match.group(1)]
+        id = int(match.group(2))
+        return (lambda session: get_detail(session, model, id, missing_msg, missing_status)), (model.__tablename__,)
+    match = FAVORITES_PATH.match(path)
+    if match:
+        user_id = int(match.group(1))
+        return (lambda session: get_favorites(session, user_id)), FAVORITE_TABLES
+    return None
+
+
+def cors_headers(headers):
+    # The same headers flask-cors adds to the Flask responses
+    if 'origin' not in headers:
+        return [('Access-Control-Allow-Origin', '*')]
+    return [('Access-Control-Allow-Origin', headers['origin']), ('Vary', 'Origin')]
+
+
+async def send_response(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.encode(), value.encode()) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle_read(scope, send):
+    query = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+    args = dict(query)
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+               for name, value in scope['headers']}
+    accept = headers.get('accept', '')
+    if len(args) != len(query) or 'ndjson' in accept:
+        return False
+    route = match_route(scope['path'], args)
+    if route is None:
+        return False
+    if AUTH_REQUIRED and await run_blocking(verify_token, bearer_token(headers.get('authorization'))) is None:
+        # Flask answers with the usual 401
+        return False
+    handler, tables = route
+
+    async with AsyncSession() as session:
+        full_path = scope['path'] + '?' + scope['query_string'].decode('latin-1')
+        etag = etag_for(full_path, accept, tables, await current_versions(session, tables))
+        etag_headers = [('ETag', f'"{etag}"')]
+        if parse_etags(headers.get('if-none-match')).contains_weak(etag):
+            await send_response(send, 304, b'', etag_headers + [('Vary', 'Accept')] + cors_headers(headers))
+            return True
+        try:
+            status, body = await handler(session)
+        except (APIException, ValueError):
+            # Let the Flask route produce its usual error response
+            return False
+
+    response_headers = cors_headers(headers)
+    if status == 200:
+        encoding = negotiate(headers.get('accept-encoding'))
+        if encoding is not None and len(body) >= COMPRESSION_MIN_SIZE:
+            body = compress_body(body, encoding, etag)
+            etag_headers = [('ETag', f'W/"{etag}"'), ('Content-Encoding', encoding)]
+        response_headers += etag_headers + [('Vary', 'Accept, Accept-Encoding')]
+    response_headers.append(('Content-Type', 'application/json'))
+    response_headers.append(('Content-Length', str(len(body))))
+    await send_response(send, status, body, response_headers)
+    return True
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def replay_body(body, receive):
+    # Hands an already read body to Flask, then goes back to the server's receive
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return replay
+
+
+async def handle_login(scope, receive, send):
+    """Checks the password on the hashing pool so the event loop stays free.
+    Returns the body it read and whether it answered the request."""
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+               for name, value in scope['headers']}
+    body = await read_body(receive)
+    # Without a secret to sign with Flask answers with the usual 503
+    if not TOKEN_SECRET or headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+        return body, False
+    try:
+        credentials = app.json.loads(body)
+    except ValueError:
+        return body, False
+    if not isinstance(credentials, dict) or 'password' not in credentials:
+        return body, False
+    if 'email' in credentials:
+        condition = User.email == credentials['email']
+    elif 'username' in credentials:
+        condition = User.username == credentials['username']
+    else:
+        return body, False
+
+    async with AsyncSession() as session:
+        user = (await session.execute(db.select(User.user_id, User.password).where(condition))).first()
+    if await verify_password_async(user.password if user else None, str(credentials['password'])):
+        status, payload = 200, {'token': issue_token(user.user_id),
+                                'expires_in': TOKEN_TTL, 'user_id': user.user_id}
+    else:
+        status, payload = 401, {'msg': 'Invalid credentials'}
+    response_body = json_body(payload)
+    await send_response(send, status, response_body, cors_headers(headers) + [
+        ('Content-Type', 'application/json'), ('Content-Length', str(len(response_body)))])
+    return body, True
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'GET' and await handle_read(scope, send):
+        return
+    if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/login':
+        body, handled = await handle_login(scope, receive, send)
+        if handled:
+            return
+        receive = replay_body(body, receive)
+    await wsgi_application(scope, receive, send)
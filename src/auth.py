@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from flask import request, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils import APIException
+from cache import entity_cache
+
+TOKEN_SECRET = os.getenv('TOKEN_SECRET')
+TOKEN_TTL = int(os.getenv('TOKEN_TTL', 3600))
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+AUTH_HASH_WORKERS = int(os.getenv('AUTH_HASH_WORKERS', os.cpu_count() or 1))
+# When set every route needs a token except the ones below
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', '0').lower() in ('1', 'true')
+PUBLIC_ENDPOINTS = ('sitemap', 'login', 'static', 'metrics')
+PASSWORD_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+# Hashing is deliberately slow, it runs here so it never ties up the event
+# loop and at most this many hashes are computed at once
+hash_pool = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix='password-hash')
+
+
+def reset_hash_pool():
+    # Threads don't survive a fork, a child gets a pool of its own
+    global hash_pool
+    hash_pool = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix='password-hash')
+
+
+os.register_at_fork(after_in_child=reset_hash_pool)
+
+
+def hash_password(password):
+    return generate_password_hash(str(password), method=PASSWORD_HASH_METHOD)
+
+
+def hash_passwords(passwords):
+    return list(hash_pool.map(hash_password, passwords))
+
+
+def is_password_hash(value):
+    return isinstance(value, str) and value.startswith(PASSWORD_HASH_PREFIXES) and '$' in value
+
+
+@lru_cache
+def dummy_hash():
+    return hash_password(secrets.token_hex(16))
+
+
+def check_password(stored, password):
+    # Unknown users are checked against a dummy hash so they take as long as
+    # a wrong password
+    matches = check_password_hash(stored if is_password_hash(stored) else dummy_hash(), password)
+    return matches and is_password_hash(stored)
+
+
+def verify_password(stored, password):
+    return hash_pool.submit(check_password, stored, password).result()
+
+
+async def verify_password_async(stored, password):
+    return await asyncio.get_running_loop().run_in_executor(hash_pool, check_password, stored, password)
+
+
+class TokenDenylist:
+    """Ids of revoked tokens, each kept only until the token would have
+    expired anyway. They live in the cache's store, so with the SQLite or
+    Redis backend a logout holds in every worker."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def revoke(self, token_id, expires):
+        self.store.revoke(token_id, expires)
+
+    def __contains__(self, token_id):
+        return self.store.is_revoked(token_id)
+
+
+revoked_tokens = TokenDenylist(entity_cache)
+
+
+def token_secret():
+    # Never the app's secret key, it falls back to a well known default
+    if not TOKEN_SECRET:
+        raise APIException('Token authentication is not configured, set TOKEN_SECRET', status_code=503)
+    return TOKEN_SECRET
+
+
+@lru_cache
+def token_serializer(secret):
+    return URLSafeTimedSerializer(secret, salt='auth-token')
+
+
+def issue_token(user_id):
+    # 8 random bytes are enough to tell tokens apart in the denylist
+    return token_serializer(token_secret()).dumps({'sub': user_id, 'jti': secrets.token_hex(8)})
+
+
+@lru_cache(maxsize=4096)
+def decode_token(token, secret):
+    """(user id, token id, expiry) of a token with a valid signature, or None.
+    Only the signature check is cached, expiry and revocation are checked
+    on every request."""
+    try:
+        payload, issued = token_serializer(secret).loads(token, return_timestamp=True)
+    except BadSignature:
+        return None
+    return payload['sub'], payload['jti'], issued.timestamp() + TOKEN_TTL
+
+
+def verify_token(token):
+    decoded = decode_token(token, token_secret()) if token else None
+    if decoded is None:
+        return None
+    user_id, token_id, expires = decoded
+    if expires <= time.time() or token_id in revoked_tokens:
+        return None
+    return decoded
+
+
+def bearer_token(authorization):
+    scheme, _, token = (authorization or '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+def authenticate():
+    decoded = verify_token(bearer_token(request.headers.get('Authorization')))
+    if decoded is None:
+        raise APIException('Missing, invalid or expired token', status_code=401)
+    g.user_id, g.token_id, g.token_expires = decoded
+
+
+def auth_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        authenticate()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def require_auth():
+    # CORS preflights never carry credentials
+    if request.method == 'OPTIONS' or request.endpoint in PUBLIC_ENDPOINTS:
+        return
+    authenticate()
+
+
+def setup_auth(app):
+    if AUTH_REQUIRED:
+        if not TOKEN_SECRET:
+            raise RuntimeError('AUTH_REQUIRED needs TOKEN_SECRET set to sign tokens with')
+        app.before_request(require_auth)
@@ -0,0 +1,117 @@
+import os
+from flask import request, jsonify, current_app
+from sqlalchemy.exc import IntegrityError
+from models import db
+from streaming import NDJSON_MIMETYPE
+from utils import APIException
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+INVALID_JSON = object()
+
+# Required fields map to the message the single-row route returns when they
+# are missing, defaults mirror what the single-row routes fill in
+USER_FIELDS = ({'email': 'Email is required',
+                'password': 'Password is required',
+                'username': 'Username is required',
+                'first_name': 'First name is required',
+                'last_name': 'Last name is required'},
+               {})
+CHARACTER_FIELDS = ({'name': 'Name is not optional',
+                     'height': 'Height is not optional',
+                     'weight': 'Weight is not optional'},
+                    {'gender': 'N/A', 'birthdate': 'N/A'})
+PLANET_FIELDS = ({'planet_name': 'Planet name is required'},
+                 {'climate': 'N/A', 'terrain': 'N/A', 'day_length_hours': 0,
+                  'year_length_days': 0, 'population': 0})
+VEHICLE_FIELDS = ({'vehicle_name': 'Vehicle name is required'},
+                  {'cargo_capacity': 0, 'number_passengers': 0,
+                   'number_crew': 1, 'model': 'N/A', 'cost': 0})
+
+
+def validate_row(body, fields):
+    required, defaults = fields
+    if body is INVALID_JSON:
+        return None, 'Invalid JSON'
+    if not isinstance(body, dict):
+        return None, 'Each row must be an object'
+    for field, msg in required.items():
+        if field not in body:
+            return None, msg
+    row = {field: body.get(field, default)
+           for field, default in defaults.items()}
+    row.update({field: body[field] for field in required})
+    return row, None
+
+
+def iter_body():
+    if request.mimetype == NDJSON_MIMETYPE:
+        # Read the NDJSON body line by line so huge uploads are never buffered
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield current_app.json.loads(line)
+            except ValueError:
+                yield INVALID_JSON
+        return
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        raise APIException('You must send a JSON array of rows', status_code=400)
+    yield from body
+
+
+def get_batch_size():
+    batch_size = request.args.get('batch_size', BULK_BATCH_SIZE, type=int)
+    return max(1, batch_size)
+
+
+def insert_batch(model, pk, rows):
+    # A single executemany, batched by insertmanyvalues with RETURNING
+    stmt = db.insert(model).returning(pk, sort_by_parameter_order=True)
+    return db.session.execute(stmt, rows).scalars().all()
+
+
+def flush_batch(model, pk, batch, inserted, errors, prepare=None):
+    if prepare is not None:
+        prepare([row for _, row in batch])
+    try:
+        inserted.extend(insert_batch(model, pk, [row for _, row in batch]))
+        db.session.commit()
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    # Something in the batch conflicts, retry row by row to find out what
+    for index, row in batch:
+        try:
+            ids = insert_batch(model, pk, [row])
+            db.session.commit()
+            inserted.extend(ids)
+        except IntegrityError:
+            db.session.rollback()
+            errors.append({'index': index,
+                           'msg': 'Row conflicts with existing data'})
+
+
+def bulk_insert(model, pk, fields, prepare=None):
+    """prepare(rows) may rewrite the valid rows of a batch before they are inserted"""
+    batch_size = get_batch_size()
+    inserted = []
+    errors = []
+    batch = []
+    for index, body in enumerate(iter_body()):
+        row, error = validate_row(body, fields)
+        if error is not None:
+            errors.append({'index': index, 'msg': error})
+            continue
+        batch.append((index, row))
+        if len(batch) >= batch_size:
+            flush_batch(model, pk, batch, inserted, errors, prepare)
+            batch = []
+    if batch:
+        flush_batch(model, pk, batch, inserted, errors, prepare)
+
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({'inserted': inserted, 'errors': errors}), 201
@@ -0,0 +1,364 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from fieldsets import project
+from rows import get_row
+from models import User, Characters, Planets, Vehicles
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')
+CACHE_PATH = os.getenv('CACHE_PATH', '/tmp/starwars-cache.db')
+CACHE_URL = os.getenv('CACHE_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+CACHE_TTL = float(os.getenv('CACHE_TTL', 60))
+PENDING_INVALIDATIONS = 'pending_invalidations'
+WHOLE_TABLE = object()
+# Tables get_serialized() caches rows of, writes to any other table leave
+# the cache alone
+CACHED_TABLES = {model.__tablename__ for model in (User, Characters, Planets, Vehicles)}
+
+
+class CacheBackend:
+    name = None
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def count(self, payload):
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload
+
+    def stats(self):
+        # Hit and miss counters are per worker, entries are whatever the store holds
+        return {'backend': self.name,
+                'entries': self.size(),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class LRUCache(CacheBackend):
+    """Bounded LRU of serialized payloads whose entries also expire after a TTL"""
+    name = 'memory'
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.revoked = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return self.count(entry and entry[1])
+
+    def generation(self, table):
+        return self.generations.get(table, 0)
+
+    def set(self, key, payload, generation):
+        with self.lock:
+            # A write committed while the payload was being loaded, it may be stale
+            if self.generation(key[0]) != generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table, id=WHOLE_TABLE):
+        with self.lock:
+            self.generations[table] = self.generation(table) + 1
+            if id is not WHOLE_TABLE:
+                self.entries.pop((table, id), None)
+                return
+            for key in [key for key in self.entries if key[0] == table]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+
+    def size(self):
+        return len(self.entries)
+
+    def revoke(self, token_id, expires):
+        with self.lock:
+            now = time.time()
+            for expired in [key for key, until in self.revoked.items() if until <= now]:
+                del self.revoked[expired]
+            self.revoked[token_id] = expires
+
+    def is_revoked(self, token_id):
+        return self.revoked.get(token_id, 0) > time.time()
+
+
+class SQLiteCache(CacheBackend):
+    """Cache kept in a local SQLite file so every gunicorn worker on the host
+    shares the same entries and sees invalidations as soon as they commit"""
+    name = 'sqlite'
+    PRUNE_EVERY = 100
+    TOUCH_AFTER = 1.0
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        self.local = threading.local()
+        self.sets = 0
+
+    def connection(self):
+        # Connections must not cross a fork, so key them by process as well
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (table_name TEXT, id INTEGER, '
+                         'expires REAL, accessed REAL, payload TEXT, PRIMARY KEY (table_name, id))')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS generations '
+                         '(table_name TEXT PRIMARY KEY, generation INTEGER)')
+            conn.execute('CREATE TABLE IF NOT EXISTS revoked (token_id TEXT PRIMARY KEY, expires REAL)')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self.connection()
+        row = conn.execute('SELECT expires, accessed, payload FROM entries WHERE table_name = ? AND id = ?',
+                           key).fetchone()
+        now = time.time()
+        if row is None:
+            return self.count(None)
+        expires, accessed, payload = row
+        if expires < now:
+            conn.execute(
+                'DELETE FROM entries WHERE table_name = ? AND id = ?', key)
+            self.evictions += 1
+            return self.count(None)
+        if now - accessed > self.TOUCH_AFTER:
+            # Recency is tracked coarsely so hot reads don't all take the write lock
+            conn.execute('UPDATE entries SET accessed = ? WHERE table_name = ? AND id = ?',
+                         (now,) + key)
+        return self.count(json.loads(payload))
+
+    def generation(self, table):
+        row = self.connection().execute(
+            'SELECT generation FROM generations WHERE table_name = ?', (table,)).fetchone()
+        return row[0] if row else 0
+
+    def set(self, key, payload, generation):
+        conn = self.connection()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if self.generation(key[0]) != generation:
+                return
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                         key + (now + self.ttl, now, json.dumps(payload)))
+        self.sets += 1
+        if self.sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = conn.execute(
+                'DELETE FROM entries WHERE expires < ?', (time.time(),)).rowcount
+            overflow = self.size() - self.max_entries
+            if overflow > 0:
+                conn.execute('DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries '
+                             'ORDER BY accessed LIMIT ?)', (overflow,))
+        self.evictions += expired + max(overflow, 0)
+
+    def invalidate(self, table, id=WHOLE_TABLE):
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO generations VALUES (?, 1) ON CONFLICT (table_name) '
+                         'DO UPDATE SET generation = generation + 1', (table,))
+            if id is WHOLE_TABLE:
+                conn.execute(
+                    'DELETE FROM entries WHERE table_name = ?', (table,))
+            else:
+                conn.execute(
+                    'DELETE FROM entries WHERE table_name = ? AND id = ?', (table, id))
+
+    def clear(self):
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM generations')
+
+    def size(self):
+        return self.connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def revoke(self, token_id, expires):
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM revoked WHERE expires <= ?', (time.time(),))
+            conn.execute('INSERT OR REPLACE INTO revoked VALUES (?, ?)', (token_id, expires))
+
+    def is_revoked(self, token_id):
+        return self.connection().execute('SELECT 1 FROM revoked WHERE token_id = ? AND expires > ?',
+                                         (token_id, time.time())).fetchone() is not None
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by every worker and host talking to the same Redis server,
+    eviction beyond the TTL is left to the server's maxmemory-policy"""
+    name = 'redis'
+
+    def __init__(self, url=CACHE_URL, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, prefix='starwars'):
+        super().__init__(max_entries, ttl)
+        if redis is None:
+            raise RuntimeError(
+                'CACHE_BACKEND=redis needs the redis package installed')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def entry_key(self, key):
+        return f'{self.prefix}:entry:{key[0]}:{key[1]}'
+
+    def generation_key(self, table):
+        return f'{self.prefix}:generation:{table}'
+
+    def revoked_key(self, token_id):
+        return f'{self.prefix}:revoked:{token_id}'
+
+    def get(self, key):
+        payload = self.client.get(self.entry_key(key))
+        return self.count(payload and json.loads(payload))
+
+    def generation(self, table):
+        return int(self.client.get(self.generation_key(table)) or 0)
+
+    def set(self, key, payload, generation):
+        if self.generation(key[0]) != generation:
+            return
+        self.client.set(self.entry_key(key), json.dumps(payload),
+                        ex=max(1, int(self.ttl)))
+
+    def invalidate(self, table, id=WHOLE_TABLE):
+        self.client.incr(self.generation_key(table))
+        if id is not WHOLE_TABLE:
+            self.client.delete(self.entry_key((table, id)))
+            return
+        keys = list(self.client.scan_iter(
+            match=f'{self.prefix}:entry:{table}:*', count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        # Revoked tokens are not cached data, they stay
+        keys = [key for pattern in ('entry', 'generation')
+                for key in self.client.scan_iter(match=f'{self.prefix}:{pattern}:*', count=1000)]
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(match=f'{self.prefix}:entry:*', count=1000))
+
+    def revoke(self, token_id, expires):
+        # The server drops the key once the token could no longer be used anyway
+        self.client.set(self.revoked_key(token_id), 1, exat=math.ceil(expires))
+
+    def is_revoked(self, token_id):
+        return bool(self.client.exists(self.revoked_key(token_id)))
+
+
+CACHE_BACKENDS = {
+    'memory': LRUCache,
+    'sqlite': SQLiteCache,
+    'redis': RedisCache,
+}
+
+
+def make_cache(backend=CACHE_BACKEND):
+    if backend not in CACHE_BACKENDS:
+        raise RuntimeError(f'Unknown CACHE_BACKEND {backend!r}, use one of ' +
+                           ', '.join(CACHE_BACKENDS))
+    return CACHE_BACKENDS[backend]()
+
+
+entity_cache = make_cache()
+
+
+def get_serialized(model, id, fields=None):
+    # Full payloads are cached so every ?fields= projection shares one entry
+    key = (model.__tablename__, id)
+    payload = entity_cache.get(key)
+    if payload is None:
+        generation = entity_cache.generation(key[0])
+        row = get_row(model, id)
+        if row is None:
+            return None
+        payload = row.serialize()
+        entity_cache.set(key, payload, generation)
+    return project(payload, model, fields)
+
+
+def pending_invalidations(session):
+    return session.info.setdefault(PENDING_INVALIDATIONS, set())
+
+
+@event.listens_for(Session, 'after_flush')
+def track_flushed_rows(session, flush_context):
+    pending = pending_invalidations(session)
+    for instance in chain(session.new, session.dirty, session.deleted):
+        identity = inspect(instance).identity
+        if identity is not None and instance.__table__.name in CACHED_TABLES:
+            pending.add((instance.__table__.name, identity[0]))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_executed_rows(orm_execute_state):
+    # Bulk UPDATE/DELETE can hit any row, so drop the whole table. Not for
+    # table_version, favorites and the like, which the cache never holds.
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table.name
+        if table in CACHED_TABLES:
+            pending_invalidations(orm_execute_state.session).add(
+                (table, WHOLE_TABLE))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_invalidations(session):
+    for table, id in session.info.pop(PENDING_INVALIDATIONS, ()):
+        entity_cache.invalidate(table, id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_invalidations(session):
+    session.info.pop(PENDING_INVALIDATIONS, None)
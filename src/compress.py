@@ -0,0 +1,127 @@
+import os
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies gain little and cost a compressor call per response
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_CACHE_ENTRIES = int(os.getenv('COMPRESSION_CACHE_ENTRIES', 256))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_LEVEL = int(os.getenv('BROTLI_LEVEL', 5))
+ZSTD_LEVEL = int(os.getenv('ZSTD_LEVEL', 3))
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+def gzip_body(body):
+    # mtime=0 keeps the output the same for the same input
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def brotli_body(body):
+    return brotli.compress(body, quality=BROTLI_LEVEL)
+
+
+def zstd_body(body):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+# Content coding: compressor, in order of preference when the client accepts
+# several with the same quality
+ENCODERS = {'gzip': gzip_body}
+if zstandard is not None:
+    ENCODERS = {'zstd': zstd_body, **ENCODERS}
+if brotli is not None:
+    ENCODERS = {'br': brotli_body, **ENCODERS}
+COMPRESSION_ENCODINGS = [encoding.strip() for encoding in
+                         os.getenv('COMPRESSION_ENCODINGS', ','.join(ENCODERS)).split(',')
+                         if encoding.strip() in ENCODERS]
+
+
+def negotiate(accept_encoding):
+    """Best content coding the client accepts, None to send the body as is"""
+    if not accept_encoding or not COMPRESSION_ENCODINGS:
+        return None
+    return parse_accept_header(accept_encoding).best_match(COMPRESSION_ENCODINGS)
+
+
+class CompressedBodies:
+    """LRU of compressed bodies by ETag and content coding. The ETag already
+    changes with the data, so entries never need invalidating."""
+
+    def __init__(self, max_entries=COMPRESSION_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'encodings': COMPRESSION_ENCODINGS, 'min_size': COMPRESSION_MIN_SIZE,
+                'entries': len(self.entries), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses}
+
+
+compressed_bodies = CompressedBodies()
+
+
+def compress_body(body, encoding, etag=None):
+    """Body compressed with the given coding, reused for a repeated ETag"""
+    if etag is None or compressed_bodies.max_entries < 1:
+        return ENCODERS[encoding](body)
+    key = (etag, encoding)
+    compressed = compressed_bodies.get(key)
+    if compressed is None:
+        compressed = ENCODERS[encoding](body)
+        compressed_bodies.set(key, compressed)
+    return compressed
+
+
+def compress_response(response):
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None or (response.content_length or 0) < COMPRESSION_MIN_SIZE:
+        return response
+    etag, weak = response.get_etag()
+    response.set_data(compress_body(response.get_data(), encoding, etag))
+    response.headers['Content-Encoding'] = encoding
+    if etag is not None:
+        # A different body for the same ETag, so it is only a weak validator
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def setup_compression(app):
+    app.after_request(compress_response)
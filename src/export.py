@@ -0,0 +1,123 @@
+import io
+import os
+import csv
+import json
+import time
+import zlib
+from models import db, TableVersion, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
+from utils import APIException
+from compress import GZIP_LEVEL
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+EXPORT_MODELS = {model.__tablename__: model for model in (
+    User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles, TableVersion)}
+# Never leaves the database, not even for analytics
+EXCLUDED_COLUMNS = {'user': ('password',)}
+# format: (mimetype, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    # First line is the list of column names, then one line per batch holding
+    # a list of values for every column. Repeated keys are written once and
+    # each column compresses well on its own.
+    'columnar': ('application/x-ndjson', 'columns.ndjson'),
+}
+EXPORT_COMPRESSIONS = ('none', 'gzip')
+
+encode = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=str).encode
+
+
+def export_columns(table):
+    excluded = EXCLUDED_COLUMNS.get(table, ())
+    return [column for column in EXPORT_MODELS[table].__table__.columns if column.key not in excluded]
+
+
+def get_export_args(table, format, compression):
+    if table not in EXPORT_MODELS:
+        raise APIException('Table must be one of ' + ', '.join(EXPORT_MODELS), status_code=404)
+    if format not in EXPORT_FORMATS:
+        raise APIException('Format must be one of ' + ', '.join(EXPORT_FORMATS), status_code=400)
+    if compression not in EXPORT_COMPRESSIONS:
+        raise APIException('Compression must be one of ' + ', '.join(EXPORT_COMPRESSIONS), status_code=400)
+    return table, format, compression
+
+
+def export_filename(table, format, compression):
+    extension = EXPORT_FORMATS[format][1]
+    return f'{table}.{extension}' + ('.gz' if compression == 'gzip' else '')
+
+
+def iter_batches(table, batch_size=EXPORT_BATCH_SIZE):
+    """Row tuples in batches straight from a server-side cursor, no ORM objects"""
+    columns = export_columns(table)
+    pk = EXPORT_MODELS[table].__table__.primary_key.columns.values()
+    stmt = db.select(*columns).order_by(*pk)
+    connection = db.session.connection().execution_options(stream_results=True, yield_per=batch_size)
+    for partition in connection.execute(stmt).partitions():
+        yield partition
+
+
+def ndjson_chunks(keys, batches):
+    for batch in batches:
+        yield ''.join(encode(dict(zip(keys, row))) + '\n' for row in batch)
+
+
+def csv_chunks(keys, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def columnar_chunks(keys, batches):
+    yield encode(keys) + '\n'
+    for batch in batches:
+        yield encode([list(column) for column in zip(*batch)]) + '\n'
+
+
+def gzip_chunks(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_table(table, format='ndjson', compression='none', batch_size=EXPORT_BATCH_SIZE, counter=None):
+    """Bytes of the whole table in the given format, produced one batch at a time"""
+    keys = [column.key for column in export_columns(table)]
+    batches = iter_batches(table, batch_size)
+    if counter is not None:
+        batches = counter(batches)
+    writer = {'ndjson': ndjson_chunks, 'csv': csv_chunks, 'columnar': columnar_chunks}[format]
+    chunks = (chunk.encode() for chunk in writer(keys, batches))
+    if compression == 'gzip':
+        chunks = gzip_chunks(chunks)
+    return chunks
+
+
+def export_file(table, path, format='ndjson', compression='none', batch_size=EXPORT_BATCH_SIZE):
+    started = time.perf_counter()
+    rows = 0
+
+    def count(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    with open(path, 'wb') as file:
+        for chunk in export_table(table, format, compression, batch_size, counter=count):
+            file.write(chunk)
+    seconds = time.perf_counter() - started
+    return {'rows': rows, 'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 1) if seconds else 0.0}
@@ -0,0 +1,266 @@
+from collections import Counter, defaultdict
+from itertools import chain
+from sqlalchemy import event, func, inspect, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, insert_ignore, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
+from utils import APIException
+from versions import touch
+from rows import select_rows, fetch_rows
+
+ADDED = 'added'
+EXISTS = 'exists'
+MISSING_USER = 'missing_user'
+MISSING_TARGET = 'missing_target'
+REMOVED = 'removed'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+FAVORITE_KINDS = {
+    'people': (FavoriteCharacters, Characters),
+    'planets': (FavoritePlanets, Planets),
+    'vehicles': (FavoriteVehicles, Vehicles),
+}
+FAVORITE_TARGETS = {model: target for model, target in FAVORITE_KINDS.values()}
+FAVORITE_CHANGES = 'favorite_changes'
+BATCH_OPS = ('add', 'remove')
+
+
+def target_column(target):
+    # Favorite tables name their foreign key after the target's primary key
+    return inspect(target).primary_key[0].key
+
+
+def record_changed_users(session, model, user_ids):
+    # Picked up after commit by whatever keeps per-user favorite state around
+    changes = session.info.setdefault(FAVORITE_CHANGES, set())
+    changes.update((model, user_id) for user_id in user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop(FAVORITE_CHANGES, None)
+
+
+def adjust_favorite_counts(session, target, deltas):
+    """Apply {target_id: delta} to the favorite counters in the current transaction"""
+    pk = inspect(target).primary_key[0]
+    ids_by_delta = defaultdict(list)
+    for target_id, delta in deltas.items():
+        if delta:
+            ids_by_delta[delta].append(target_id)
+    # Counters are not part of any serialized payload, so they go straight to
+    # the connection and skip the cache and version hooks on the session
+    connection = session.connection()
+    for delta, ids in sorted(ids_by_delta.items()):
+        connection.execute(db.update(target).where(pk.in_(sorted(ids))).values(
+            favorite_count=target.favorite_count + delta))
+
+
+@event.listens_for(Session, 'after_flush')
+def count_flushed_favorites(session, flush_context):
+    # The routes write favorites with plain statements and adjust the counters
+    # themselves, this covers favorites going through the unit of work
+    # instead (admin views, cascades from deleting a user)
+    deltas = defaultdict(Counter)
+    for instances, sign in ((session.new, 1), (session.deleted, -1)):
+        for instance in instances:
+            target = FAVORITE_TARGETS.get(type(instance))
+            if target is not None:
+                deltas[target][getattr(instance, target_column(target))] += sign
+                record_changed_users(session, type(instance), [instance.user_id])
+    for instance in session.dirty:
+        target = FAVORITE_TARGETS.get(type(instance))
+        if target is not None:
+            history = inspect(instance).attrs[target_column(target)].history
+            for target_id in history.added or ():
+                deltas[target][target_id] += 1
+            for target_id in history.deleted or ():
+                deltas[target][target_id] -= 1
+            user_history = inspect(instance).attrs.user_id.history
+            record_changed_users(session, type(instance), chain(
+                [instance.user_id], user_history.deleted or ()))
+    for target, target_deltas in deltas.items():
+        adjust_favorite_counts(session, target, target_deltas)
+
+
+def find_missing(target, user_id, target_id):
+    # Only reached after a failed write, the happy path never reads first
+    if db.session.get(User, user_id) is None:
+        return MISSING_USER
+    if db.session.get(target, target_id) is None:
+        return MISSING_TARGET
+    return EXISTS
+
+
+def add_favorite(model, target, user_id, target_id):
+    values = {'user_id': user_id, target_column(target): target_id}
+    try:
+        result = db.session.execute(insert_ignore(model, values))
+        adjust_favorite_counts(db.session, target, {target_id: result.rowcount})
+        if result.rowcount:
+            record_changed_users(db.session, model, [user_id])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return find_missing(target, user_id, target_id)
+    if not result.rowcount and db.session.get_bind().dialect.name == 'mysql':
+        # INSERT IGNORE skipped it, as a duplicate or for a missing parent
+        return find_missing(target, user_id, target_id)
+    return ADDED if result.rowcount else EXISTS
+
+
+def remove_favorite(model, target, user_id, target_id):
+    if not delete_favorites(model, getattr(model, target_column(target)), [(user_id, target_id)]):
+        db.session.rollback()
+        status = find_missing(target, user_id, target_id)
+        return NOT_FOUND if status == EXISTS else status
+    adjust_favorite_counts(db.session, target, {target_id: -1})
+    record_changed_users(db.session, model, [user_id])
+    db.session.commit()
+    return REMOVED
+
+
+def validate_operation(operation):
+    if not isinstance(operation, dict):
+        return 'Each operation must be an object'
+    if operation.get('kind') not in FAVORITE_KINDS:
+        return 'Kind must be one of ' + ', '.join(FAVORITE_KINDS)
+    if operation.get('op') not in BATCH_OPS:
+        return 'Op must be one of ' + ', '.join(BATCH_OPS)
+    for field in ('user_id', 'entity_id'):
+        value = operation.get(field)
+        if not isinstance(value, int) or isinstance(value, bool):
+            return f'{field} must be an integer'
+    return None
+
+
+def existing_ids(column, ids):
+    if not ids:
+        return set()
+    return set(db.session.execute(db.select(column).where(column.in_(ids))).scalars())
+
+
+def existing_favorites(model, column, pairs):
+    if not pairs:
+        return set()
+    stmt = db.select(model.user_id, column).where(
+        tuple_(model.user_id, column).in_(pairs))
+    return set(map(tuple, db.session.execute(stmt)))
+
+
+def insert_favorites(model, column, pairs):
+    """(user_id, target_id) pairs the insert actually added, a concurrent
+    writer may have added some of them first"""
+    stmt = insert_ignore(model, [{'user_id': user_id, column.key: target_id} for user_id, target_id in pairs])
+    if not db.session.get_bind().dialect.insert_returning:
+        # One statement per pair so each rowcount says whether that pair was added
+        return [(user_id, target_id) for user_id, target_id in pairs
+                if db.session.execute(insert_ignore(model, {'user_id': user_id, column.key: target_id})).rowcount]
+    return db.session.execute(stmt.returning(model.user_id, column)).all()
+
+
+def delete_favorites(model, column, pairs):
+    """(user_id, target_id) pairs the delete actually removed"""
+    if db.session.get_bind().dialect.delete_returning:
+        return db.session.execute(db.delete(model).where(
+            tuple_(model.user_id, column).in_(pairs)).returning(model.user_id, column)).all()
+    # One statement per pair so each rowcount says whether that pair went
+    return [(user_id, target_id) for user_id, target_id in pairs
+            if db.session.execute(db.delete(model).filter_by(
+                user_id=user_id, **{column.key: target_id})).rowcount]
+
+
+def apply_favorite_batch(operations):
+    results = [None] * len(operations)
+    valid = []
+    for index, operation in enumerate(operations):
+        error = validate_operation(operation)
+        if error is not None:
+            results[index] = {'status': INVALID, 'msg': error}
+        else:
+            valid.append((index, operation))
+
+    # One existence query for users and one per entity type
+    users = existing_ids(User.user_id, {op['user_id'] for _, op in valid})
+    for kind, (model, target) in FAVORITE_KINDS.items():
+        ops = [(index, op) for index, op in valid if op['kind'] == kind]
+        if not ops:
+            continue
+        column = getattr(model, target_column(target))
+        targets = existing_ids(inspect(target).primary_key[0],
+                               {op['entity_id'] for _, op in ops})
+        pairs = {(op['user_id'], op['entity_id']) for _, op in ops}
+        initial = existing_favorites(model, column, pairs)
+
+        # Replay the operations in order against the current state so an add
+        # followed by a remove of the same favorite behaves as expected
+        state = set(initial)
+        for index, op in ops:
+            pair = (op['user_id'], op['entity_id'])
+            if op['user_id'] not in users:
+                status = MISSING_USER
+            elif op['entity_id'] not in targets:
+                status = MISSING_TARGET
+            elif op['op'] == 'add':
+                status = EXISTS if pair in state else ADDED
+                state.add(pair)
+            else:
+                status = REMOVED if pair in state else NOT_FOUND
+                state.discard(pair)
+            results[index] = {'status': status}
+
+        to_add = state - initial
+        to_remove = initial - state
+        # The counters follow what the statements changed, not the diff above,
+        # which is stale if another request wrote the same favorites meanwhile
+        added = insert_favorites(model, column, sorted(to_add)) if to_add else []
+        removed = delete_favorites(model, column, sorted(to_remove)) if to_remove else []
+        deltas = Counter(target_id for _, target_id in added)
+        deltas.subtract(target_id for _, target_id in removed)
+        adjust_favorite_counts(db.session, target, deltas)
+        record_changed_users(
+            db.session, model, {user_id for user_id, _ in chain(added, removed)})
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise APIException('Favorites changed while applying the batch, try again', status_code=409)
+    return results
+
+
+def favorite_targets(kind, user_id):
+    """Select for the targets a user picked, as rows for select_rows(target)"""
+    model, target = FAVORITE_KINDS[kind]
+    column = getattr(model, target_column(target))
+    # Same order as reading the (user_id, target) unique index
+    return select_rows(target).join(model, column == inspect(target).primary_key[0]).where(
+        model.user_id == user_id).order_by(column)
+
+
+def leaderboard(kind, top):
+    model, target = FAVORITE_KINDS[kind]
+    pk = inspect(target).primary_key[0]
+    # Matches the (favorite_count, pk) index read backwards
+    stmt = select_rows(target, ('favorite_count',)).where(target.favorite_count > 0).order_by(
+        target.favorite_count.desc(), pk.desc()).limit(top)
+    return [dict(row.serialize(), favorite_count=row.favorite_count)
+            for row in fetch_rows(stmt, target, ('favorite_count',))]
+
+
+def reconcile_favorite_counts():
+    connection = db.session.connection()
+    for model, target in FAVORITE_KINDS.values():
+        column = getattr(model, target_column(target))
+        pk = inspect(target).primary_key[0]
+        # One grouped pass over the favorites instead of a count per target,
+        # the target column alone has no index to make those counts cheap
+        counts = db.select(column.label('target_id'), func.count().label('favorites')).group_by(
+            column).subquery()
+        connection.execute(db.update(target).where(target.favorite_count != 0).values(favorite_count=0))
+        connection.execute(db.update(target).where(pk == counts.c.target_id).values(
+            favorite_count=counts.c.favorites))
+        # Leaderboard ETags follow the favorite tables
+        touch(db.session, model.__tablename__)
+    db.session.commit()
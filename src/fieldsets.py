@@ -0,0 +1,37 @@
+from functools import lru_cache
+from flask import request
+from utils import APIException
+
+
+@lru_cache
+def serialized_columns(model):
+    # serialize() returns every column except the ones a model keeps hidden
+    hidden = getattr(model, 'hidden_columns', ())
+    return tuple(column.key for column in model.__table__.columns if column.key not in hidden)
+
+
+def get_fields(*models):
+    """Columns asked for with ?fields=, or None when the client wants all of them"""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = tuple(dict.fromkeys(field.strip()
+                   for field in fields.split(',') if field.strip()))
+    allowed = {column for model in models for column in serialized_columns(model)}
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIException('Unknown fields: ' + ', '.join(unknown), status_code=400)
+    return fields or None
+
+
+@lru_cache(maxsize=1024)
+def model_fields(model, fields):
+    if fields is None:
+        return None
+    return tuple(field for field in fields if field in serialized_columns(model))
+
+
+def project(payload, model, fields):
+    if fields is None:
+        return payload
+    return {field: payload[field] for field in model_fields(model, fields)}
@@ -0,0 +1,67 @@
+import operator
+from flask import request
+from utils import APIException
+
+# Query parameters the list routes use for something other than filtering
+RESERVED_ARGS = ('limit', 'cursor', 'fields', 'stream', 'sort')
+OPERATORS = {
+    'gte': operator.ge,
+    'gt': operator.gt,
+    'lte': operator.le,
+    'lt': operator.lt,
+}
+
+
+def filter_column(model, name):
+    # Only columns the model lists as filterable are indexed, anything else
+    # would turn into a full scan
+    if name not in model.filterable_columns:
+        return None
+    return getattr(model, name)
+
+
+def parse_arg(name):
+    base, _, suffix = name.rpartition('_')
+    if base and suffix in OPERATORS:
+        return base, OPERATORS[suffix]
+    return name, operator.eq
+
+
+def convert(column, name, value):
+    python_type = column.type.python_type
+    try:
+        return python_type(value)
+    except ValueError:
+        raise APIException(f'{name} must be a {python_type.__name__}', status_code=400)
+
+
+def get_filters(model):
+    filters = []
+    for name, value in request.args.items(multi=True):
+        if name in RESERVED_ARGS:
+            continue
+        column_name, compare = parse_arg(name)
+        column = filter_column(model, column_name)
+        if column is None and compare is not operator.eq:
+            # e.g. a column whose own name ends in _lt
+            column_name, compare = name, operator.eq
+            column = filter_column(model, name)
+        if column is None:
+            raise APIException(f'Cannot filter by {name}', status_code=400)
+        filters.append(compare(column, convert(column, name, value)))
+    return filters
+
+
+def get_sort(model, pk):
+    """Column to order by and whether it is descending, defaults to the primary key"""
+    sort = request.args.get('sort')
+    if not sort:
+        return pk, False
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name == pk.key:
+        return pk, descending
+    column = filter_column(model, name)
+    if column is None:
+        raise APIException(f'Cannot sort by {name}', status_code=400)
+    return column, descending
@@ -0,0 +1,303 @@
+import io
+import os
+import csv
+import json
+import math
+import time
+from itertools import islice
+from sqlalchemy import inspect, text
+from models import db, Characters, Planets, Vehicles
+from versions import touch
+from cache import pending_invalidations, WHOLE_TABLE
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 5000))
+IMPORT_FORMATS = ('json', 'ndjson', 'csv')
+READ_SIZE = 64 * 1024
+UNKNOWN = ('', 'unknown', 'n/a', 'none', 'null')
+# Integer columns are 32 bit on Postgres, SWAPI has populations above that
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def to_str(value):
+    value = str(value).strip()
+    return None if value.lower() in UNKNOWN else value
+
+
+def to_number(convert):
+    def parse(value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            number = value
+        else:
+            value = to_str(value)
+            if value is None:
+                return None
+            try:
+                number = float(value.replace(',', ''))
+            except ValueError:
+                # e.g. SWAPI's "30-165"
+                return None
+        try:
+            # float() of a huge int overflows, and "1e400" or "nan" parse
+            # to values no column can hold
+            number = convert(number)
+            if not math.isfinite(number):
+                return None
+        except (OverflowError, ValueError):
+            return None
+        if convert is int and abs(number) > MAX_INTEGER:
+            return None
+        return number
+    return parse
+
+
+to_int = to_number(int)
+to_float = to_number(float)
+
+# kind: (model, natural key, {column: (names in the file, parser, default)}).
+# Our own column names are accepted too, so exports can be imported back.
+IMPORT_KINDS = {
+    'people': (Characters, 'name', {
+        'name': (('name',), to_str, None),
+        'gender': (('gender',), to_str, 'N/A'),
+        'height': (('height',), to_int, 0),
+        'weight': (('weight', 'mass'), to_int, 0),
+        'birthdate': (('birthdate', 'birth_year'), to_str, 'N/A'),
+    }),
+    'planets': (Planets, 'planet_name', {
+        'planet_name': (('planet_name', 'name'), to_str, None),
+        'climate': (('climate',), to_str, 'N/A'),
+        'terrain': (('terrain',), to_str, 'N/A'),
+        'day_length_hours': (('day_length_hours', 'rotation_period'), to_int, 0),
+        'year_length_days': (('year_length_days', 'orbital_period'), to_int, 0),
+        'population': (('population',), to_int, 0),
+    }),
+    'vehicles': (Vehicles, 'vehicle_name', {
+        'vehicle_name': (('vehicle_name', 'name'), to_str, None),
+        'model': (('model',), to_str, 'N/A'),
+        'cargo_capacity': (('cargo_capacity',), to_float, 0),
+        'number_passengers': (('number_passengers', 'passengers'), to_int, 0),
+        'number_crew': (('number_crew', 'crew'), to_int, 1),
+        'cost': (('cost', 'cost_in_credits'), to_int, 0),
+    }),
+}
+
+
+def iter_json_array(file):
+    """Items of a JSON array, or of the "results" array of a SWAPI page,
+    decoded one at a time from a file read in chunks"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    # Read up to the opening bracket of the array
+    while True:
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+        start = buffer.lstrip()
+        if start.startswith('{') and '"results"' in start:
+            start = start[start.index('"results"') + len('"results"'):].lstrip()
+            start = start[1:].lstrip() if start.startswith(':') else start
+        if start.startswith('['):
+            buffer = start[1:]
+            break
+        if eof or (start and not start.startswith('{')):
+            raise ValueError('Expected a JSON array or an object with "results"')
+
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+            # A number at the very end of the buffer may go on in the next chunk
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('Truncated or invalid JSON')
+            complete = False
+        if not complete:
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_records(file, format):
+    if format == 'csv':
+        records = csv.DictReader(file)
+    elif format == 'ndjson':
+        records = iter_ndjson(file)
+    else:
+        records = iter_json_array(file)
+    for record in records:
+        # SWAPI fixtures wrap every row as {"model": ..., "pk": ..., "fields": {...}}
+        if isinstance(record, dict) and isinstance(record.get('fields'), dict):
+            record = record['fields']
+        yield record
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'ndjson'
+    return extension if extension in IMPORT_FORMATS else 'json'
+
+
+def convert_record(record, model, key, columns):
+    """(row, whether a string was cut to its column length). The row only has
+    the columns the record has, so an upsert leaves the others alone"""
+    if not isinstance(record, dict):
+        return None, False
+    row = {}
+    truncated = False
+    for column, (names, parse, default) in columns.items():
+        if not any(name in record for name in names):
+            continue
+        value = next((record[name] for name in names if record.get(name) is not None), None)
+        value = parse(value) if value is not None else None
+        length = getattr(model.__table__.c[column].type, 'length', None)
+        if isinstance(value, str) and length and len(value) > length:
+            value = value[:length]
+            truncated = True
+        row[column] = default if value is None else value
+    return (row, truncated) if row.get(key) is not None else (None, False)
+
+
+def with_defaults(row, columns):
+    return {column: row.get(column, default) for column, (names, parse, default) in columns.items()}
+
+
+class ImportStats:
+    def __init__(self, progress=None):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.progress = progress
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+    def report(self):
+        if self.progress is not None:
+            self.progress(f'{self.read} rows read, {self.rate():.0f} rows/s')
+
+    def summary(self):
+        return {'read': self.read, 'inserted': self.inserted, 'updated': self.updated,
+                'skipped': self.skipped, 'truncated': self.truncated, 'seconds': round(time.perf_counter() - self.started, 3),
+                'rows_per_second': round(self.rate(), 1)}
+
+
+def iter_batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_batches(model, key, columns, batches, upsert, stats):
+    """Batched executemany through the session, committed once at the end"""
+    pk = inspect(model).primary_key[0]
+    key_column = getattr(model, key)
+    for batch in batches:
+        if upsert:
+            # The last row for a natural key wins, inside the file and over the table
+            latest = {row[key]: row for row in batch}
+            existing = {}
+            for value, id in db.session.execute(
+                    db.select(key_column, pk).where(key_column.in_(latest))):
+                existing.setdefault(value, []).append(id)
+            updates = [dict(row, **{pk.key: id})
+                       for value, row in latest.items() for id in existing.get(value, ())]
+            batch = [row for value, row in latest.items() if value not in existing]
+            if updates:
+                # ORM bulk UPDATE by primary key, one executemany per set of
+                # columns the rows have
+                db.session.execute(db.update(model), updates)
+                stats.updated += len(updates)
+        if batch:
+            db.session.execute(db.insert(model), [with_defaults(row, columns) for row in batch])
+            stats.inserted += len(batch)
+        stats.report()
+    db.session.commit()
+
+
+def copy_rows(model, key, columns, batches, upsert, stats):
+    """COPY into a temporary staging table, then merge it in with two statements"""
+    table = model.__tablename__
+    defaults = {column: default for column, (names, parse, default) in columns.items()}
+    columns = list(columns)
+    column_list = ', '.join(columns)
+    connection = db.session.connection()
+    connection.execute(text(
+        f'CREATE TEMPORARY TABLE import_{table} ON COMMIT DROP AS '
+        f'SELECT {column_list} FROM {table} WITH NO DATA'))
+    connection.execute(text(f'ALTER TABLE import_{table} ADD COLUMN import_seq bigserial'))
+    cursor = connection.connection.driver_connection.cursor()
+    for batch in batches:
+        # One COPY per batch keeps the buffer bounded. Columns the record
+        # didn't have are NULL, strings are never empty so they stay apart
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([row.get(column) for column in columns] for row in batch)
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY import_{table} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+        stats.report()
+
+    staged = f'import_{table}'
+    if upsert:
+        staged = (f'(SELECT DISTINCT ON ({key}) * FROM import_{table} '
+                  f'ORDER BY {key}, import_seq DESC) AS staged')
+        assignments = ', '.join(f'{column} = COALESCE(staged.{column}, {table}.{column})'
+                                for column in columns if column != key)
+        result = connection.execute(text(
+            f'UPDATE {table} SET {assignments} FROM {staged} WHERE {table}.{key} = staged.{key}'))
+        stats.updated += result.rowcount
+        staged += f' WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.{key} = staged.{key})'
+    # Defaults only fill in the columns a new row is missing
+    values = ', '.join(f'COALESCE({column}, :{column})' for column in columns)
+    result = connection.execute(text(
+        f'INSERT INTO {table} ({column_list}) SELECT {values} FROM {staged}'), defaults)
+    stats.inserted += result.rowcount
+
+    # Raw SQL skips the session hooks, bump the version and drop cached rows here
+    touch(db.session, table)
+    pending_invalidations(db.session).add((table, WHOLE_TABLE))
+    db.session.commit()
+
+
+def import_file(kind, file, format, upsert=False, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    model, key, columns = IMPORT_KINDS[kind]
+    stats = ImportStats(progress)
+
+    def rows():
+        for record in iter_records(file, format):
+            stats.read += 1
+            row, truncated = convert_record(record, model, key, columns)
+            if row is None:
+                stats.skipped += 1
+                continue
+            stats.truncated += truncated
+            yield row
+
+    batches = iter_batches(rows(), batch_size)
+    try:
+        if db.session.get_bind().dialect.name == 'postgresql':
+            copy_rows(model, key, columns, batches, upsert, stats)
+        else:
+            import_batches(model, key, columns, batches, upsert, stats)
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats.summary()
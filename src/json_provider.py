@@ -0,0 +1,52 @@
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson' if orjson is not None else 'default')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson behind app.json. Keys are sorted and dates, decimals and UUIDs
+    go through Flask's default() as with the default provider, the only
+    difference in the output is UTF-8 instead of \\u escapes."""
+
+    # orjson never escapes non-ASCII text, rowjson reads this to match it
+    ensure_ascii = False
+
+    def options(self):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # e.g. indent=, which orjson only supports as 2 spaces
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default,
+                            option=self.options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'default': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def make_json_provider(app, provider=JSON_PROVIDER):
+    if provider not in JSON_PROVIDERS:
+        raise RuntimeError(f'Unknown JSON_PROVIDER {provider!r}, use one of ' +
+                           ', '.join(JSON_PROVIDERS))
+    if provider == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson needs the orjson package')
+    return JSON_PROVIDERS[provider](app)
@@ -0,0 +1,116 @@
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# [statements, db seconds, start of the running statement] for the request in
+# this context, None outside requests. A cursor runs one statement at a time
+# so a single start time is enough.
+current_queries = ContextVar('current_queries', default=None)
+
+
+class EndpointMetrics:
+    def __init__(self):
+        # Per bucket counts, made cumulative when exported
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency = 0.0
+        self.statements = 0
+        self.db_time = 0.0
+        self.response_bytes = 0
+
+
+class Metrics:
+    """Per endpoint request metrics of this worker"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, method, endpoint, status, latency, statements, db_time, response_bytes):
+        key = (method, endpoint, str(status))
+        with self.lock:
+            metrics = self.endpoints.get(key)
+            if metrics is None:
+                metrics = self.endpoints[key] = EndpointMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.count += 1
+            metrics.latency += latency
+            metrics.statements += statements
+            metrics.db_time += db_time
+            metrics.response_bytes += response_bytes
+
+    def export(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            snapshot = [(key, list(metrics.buckets), metrics.count, metrics.latency, metrics.statements,
+                         metrics.db_time, metrics.response_bytes) for key, metrics in endpoints]
+
+        lines = ['# HELP http_request_duration_seconds Time spent answering requests.',
+                 '# TYPE http_request_duration_seconds histogram']
+        for key, buckets, count, latency, *_ in snapshot:
+            labels = 'method="{}",endpoint="{}",status="{}"'.format(*key)
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {latency}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+        counters = [
+            ('http_request_sql_statements_total', 'SQL statements executed while answering requests.', 4),
+            ('http_request_db_seconds_total', 'Time spent in the database while answering requests.', 5),
+            ('http_response_bytes_total', 'Bytes sent in response bodies.', 6),
+        ]
+        for name, help_text, index in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for row in snapshot:
+                labels = 'method="{}",endpoint="{}",status="{}"'.format(*row[0])
+                lines.append(f'{name}{{{labels}}} {row[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    if queries is not None:
+        queries[2] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    if queries is not None:
+        queries[0] += 1
+        queries[1] += time.perf_counter() - queries[2]
+
+
+def start_request():
+    request.metrics_start = time.perf_counter()
+    current_queries.set([0, 0.0, 0.0])
+
+
+def finish_request(response):
+    queries = current_queries.get()
+    if queries is None:
+        return response
+    current_queries.set(None)
+    # Streamed bodies have no length up front and count as 0 bytes
+    request_metrics.record(request.method, request.endpoint or 'unmatched', response.status_code,
+                           time.perf_counter() - request.metrics_start, queries[0], queries[1],
+                           response.content_length or 0)
+    return response
+
+
+def setup_metrics(app):
+    app.before_request(start_request)
+    app.after_request(finish_request)
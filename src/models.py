@@ -1,12 +1,53 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, Boolean, Integer, ForeignKey, Float
+from sqlalchemy import String, Boolean, Integer, ForeignKey, Float, Index, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 db = SQLAlchemy()
 
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys unless asked to, the favorite routes rely on them
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def insert_ignore(model, rows):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model).values(rows).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(model).values(rows).on_conflict_do_nothing()
+    if dialect == 'mysql':
+        # IGNORE also turns foreign key errors into warnings, so a row that
+        # wasn't inserted may be missing its parent rather than a duplicate
+        return db.insert(model).values(rows).prefix_with('IGNORE')
+    # Other backends raise on the unique index and callers handle IntegrityError
+    return db.insert(model).values(rows)
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+    table_name: Mapped[str] = mapped_column(String(40), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'{self.table_name} v{self.version}'
+
+
 class User(db.Model):
     __tablename__ = 'user'
+    hidden_columns = ('password',)
+    # Every filterable column has an index with the primary key appended so
+    # filtered and sorted pages are index seeks
+    filterable_columns = ('username', 'email', 'last_name')
+    __table_args__ = (
+        Index('ix_user_last_name', 'last_name', 'user_id'),)
     user_id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(
         String(120), unique=True, nullable=False)
@@ -37,12 +78,23 @@ class User(db.Model):
 
 class Characters(db.Model):
     __tablename__ = 'characters'
+    hidden_columns = ('favorite_count',)
+    filterable_columns = ('name', 'gender', 'height', 'weight')
+    __table_args__ = (
+        Index('ix_characters_favorite_count', 'favorite_count', 'character_id'),
+        Index('ix_characters_name', 'name', 'character_id'),
+        Index('ix_characters_gender', 'gender', 'character_id'),
+        Index('ix_characters_height', 'height', 'character_id'),
+        Index('ix_characters_weight', 'weight', 'character_id'),)
     character_id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(40), nullable=False)
     gender: Mapped[str] = mapped_column(String(10))
     height: Mapped[int] = mapped_column(Integer)
     weight: Mapped[int] = mapped_column(Integer)
     birthdate: Mapped[str] = mapped_column(String(20))
+    # Kept in step with the favorite table by favorites.py
+    favorite_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
     favorite_by: Mapped[list['FavoriteCharacters']
                         ] = relationship(back_populates='character',cascade='all, delete-orphan')
 
@@ -62,6 +114,17 @@ class Characters(db.Model):
 
 class Planets(db.Model):
     __tablename__ = 'planets'
+    hidden_columns = ('favorite_count',)
+    filterable_columns = ('planet_name', 'climate', 'terrain', 'population',
+                          'day_length_hours', 'year_length_days')
+    __table_args__ = (
+        Index('ix_planets_favorite_count', 'favorite_count', 'planet_id'),
+        Index('ix_planets_planet_name', 'planet_name', 'planet_id'),
+        Index('ix_planets_climate', 'climate', 'planet_id'),
+        Index('ix_planets_terrain', 'terrain', 'planet_id'),
+        Index('ix_planets_population', 'population', 'planet_id'),
+        Index('ix_planets_day_length_hours', 'day_length_hours', 'planet_id'),
+        Index('ix_planets_year_length_days', 'year_length_days', 'planet_id'),)
     planet_id: Mapped[int] = mapped_column(primary_key=True)
     planet_name: Mapped[str] = mapped_column(String(20))
     climate: Mapped[str] = mapped_column(String(20))
@@ -69,6 +132,8 @@ class Planets(db.Model):
     day_length_hours: Mapped[int] = mapped_column(Integer)
     year_length_days: Mapped[int] = mapped_column(Integer)
     population: Mapped[int] = mapped_column(Integer)
+    favorite_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
     favorite_by: Mapped[list['FavoritePlanets']
                         ] = relationship(back_populates='planet',cascade='all, delete-orphan')
 
@@ -89,6 +154,17 @@ class Planets(db.Model):
 
 class Vehicles(db.Model):
     __tablename__ = 'vehicles'
+    hidden_columns = ('favorite_count',)
+    filterable_columns = ('vehicle_name', 'model', 'cost', 'cargo_capacity',
+                          'number_passengers', 'number_crew')
+    __table_args__ = (
+        Index('ix_vehicles_favorite_count', 'favorite_count', 'vehicle_id'),
+        Index('ix_vehicles_vehicle_name', 'vehicle_name', 'vehicle_id'),
+        Index('ix_vehicles_model', 'model', 'vehicle_id'),
+        Index('ix_vehicles_cost', 'cost', 'vehicle_id'),
+        Index('ix_vehicles_cargo_capacity', 'cargo_capacity', 'vehicle_id'),
+        Index('ix_vehicles_number_passengers', 'number_passengers', 'vehicle_id'),
+        Index('ix_vehicles_number_crew', 'number_crew', 'vehicle_id'),)
     vehicle_id: Mapped[int] = mapped_column(primary_key=True)
     vehicle_name: Mapped[str] = mapped_column(String(40))
     cargo_capacity: Mapped[float] = mapped_column(Float)
@@ -96,6 +172,8 @@ class Vehicles(db.Model):
     number_crew: Mapped[int] = mapped_column(Integer)
     model: Mapped[str] = mapped_column(String(40))
     cost: Mapped[int] = mapped_column(Integer)
+    favorite_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
     favorite_by: Mapped[list['FavoriteVehicles']
                         ] = relationship(back_populates='vehicle',cascade='all, delete-orphan')
 
@@ -116,6 +194,8 @@ class Vehicles(db.Model):
 
 class FavoriteCharacters(db.Model):
     __tablename__ = 'favoritecharacters'
+    __table_args__ = (
+        Index('ix_favoritecharacters_user_id_character_id', 'user_id', 'character_id', unique=True),)
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id'))
     user: Mapped['User'] = relationship(back_populates='favorite_characters')
@@ -137,6 +217,8 @@ class FavoriteCharacters(db.Model):
 
 class FavoritePlanets(db.Model):
     __tablename__ = 'favoriteplanets'
+    __table_args__ = (
+        Index('ix_favoriteplanets_user_id_planet_id', 'user_id', 'planet_id', unique=True),)
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id'))
     user: Mapped['User'] = relationship(back_populates='favorite_planets')
@@ -156,6 +238,8 @@ class FavoritePlanets(db.Model):
 
 class FavoriteVehicles(db.Model):
     __tablename__ = 'favoritevehicles'
+    __table_args__ = (
+        Index('ix_favoritevehicles_user_id_vehicle_id', 'user_id', 'vehicle_id', unique=True),)
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id'))
     user: Mapped['User'] = relationship(back_populates='favorite_vehicles')
@@ -0,0 +1,82 @@
+import os
+import json
+import base64
+import binascii
+from flask import request
+from sqlalchemy import tuple_
+from models import db
+from utils import APIException
+from filtering import get_filters, get_sort
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise APIException('Invalid cursor', status_code=400)
+    if not isinstance(values, list):
+        raise APIException('Invalid cursor', status_code=400)
+    return values
+
+
+def get_page_args():
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise APIException('Limit must be an integer', status_code=400)
+    if limit < 1:
+        raise APIException('Limit must be greater than 0', status_code=400)
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    return limit, after
+
+
+def list_statement(model, pk, columns, after=None):
+    """Filtered, sorted select for a collection route and the columns its
+    cursor is made of. Rows hold the given columns, followed by any cursor
+    column that isn't one of them."""
+    sort, descending = get_sort(model, pk)
+    # Ties on the sort column are broken by the primary key so the order is total
+    keys = [pk] if sort is pk else [sort, pk]
+
+    stmt = db.select(*[getattr(model, name) for name in row_columns(columns, keys)])
+    stmt = stmt.where(*get_filters(model))
+    if after is not None:
+        # Seek past the last row of the previous page instead of using OFFSET
+        if len(after) != len(keys):
+            raise APIException('Invalid cursor', status_code=400)
+        seek = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*after) if len(keys) > 1 else after[0]
+        stmt = stmt.where(seek < bound if descending else seek > bound)
+    stmt = stmt.order_by(*[key.desc() if descending else key for key in keys])
+    return stmt, keys
+
+
+def row_columns(columns, keys):
+    return list(columns) + [key.key for key in keys if key.key not in columns]
+
+
+def paginate(model, pk, columns):
+    """One page of plain row tuples, no ORM instances are loaded"""
+    limit, after = get_page_args()
+    stmt, keys = list_statement(model, pk, columns, after)
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        names = row_columns(columns, keys)
+        next_cursor = encode_cursor([rows[-1][names.index(key.key)] for key in keys])
+    return rows, next_cursor
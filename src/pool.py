@@ -0,0 +1,95 @@
+import os
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Defaults per backend, every one of them can be overridden with DB_POOL_*
+POOL_DEFAULTS = {
+    # SQLite connections are cheap and local, stale ones never happen
+    'sqlite': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30,
+               'pool_recycle': -1, 'pool_pre_ping': False},
+    # Recycle below the usual idle timeouts of managed Postgres and proxies
+    'postgresql': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10,
+                   'pool_recycle': 1800, 'pool_pre_ping': True},
+}
+POOL_ENV = {
+    'pool_size': ('DB_POOL_SIZE', int),
+    'max_overflow': ('DB_MAX_OVERFLOW', int),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float),
+    'pool_recycle': ('DB_POOL_RECYCLE', int),
+    'pool_pre_ping': ('DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes')),
+}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_checked_out = 0
+
+    def stats(self, pool):
+        # Counters are per worker, like the cache stats
+        stats = {'pool': type(pool).__name__,
+                 'checkouts': self.checkouts,
+                 'timeouts': self.timeouts,
+                 'wait_total_ms': round(self.wait_total * 1000, 3),
+                 'wait_avg_ms': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                 'wait_max_ms': round(self.wait_max * 1000, 3),
+                 'peak_checked_out': self.peak_checked_out}
+        if isinstance(pool, QueuePool):
+            stats.update({'size': pool.size(),
+                          'max_overflow': pool._max_overflow,
+                          'checked_out': pool.checkedout(),
+                          'checked_in': pool.checkedin(),
+                          'overflow': max(pool.overflow(), 0)})
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited and how many timed out"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            pool_metrics.wait_total += waited
+            pool_metrics.wait_max = max(pool_metrics.wait_max, waited)
+            pool_metrics.checkouts += 1
+        pool_metrics.peak_checked_out = max(pool_metrics.peak_checked_out, self.checkedout())
+        return connection
+
+
+def engine_options(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory databases live in one connection, keep SQLAlchemy's own pool
+        return {}
+    options = dict(POOL_DEFAULTS.get(backend, POOL_DEFAULTS['postgresql']))
+    for option, (name, convert) in POOL_ENV.items():
+        value = os.getenv(name)
+        if value is not None:
+            options[option] = convert(value)
+    options['poolclass'] = InstrumentedQueuePool
+    return options
+
+
+def dispose_after_fork(app, db):
+    """Workers forked from a master that preloaded the app (gunicorn --preload)
+    start with empty pools instead of sharing the master's connections"""
+    def dispose():
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+    os.register_at_fork(after_in_child=dispose)
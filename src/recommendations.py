@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db
+from favorites import FAVORITE_KINDS, FAVORITE_CHANGES, target_column
+from versions import current_versions, BUMPED_TABLES
+from rows import select_rows, fetch_rows
+
+RELATED_TOP_K = int(os.getenv('RELATED_TOP_K', 20))
+# Other workers' favorite writes are only picked up by a full rebuild. It
+# runs in the background, once the last one is at least this many seconds old.
+RELATED_MAX_AGE = float(os.getenv('RELATED_MAX_AGE', 300))
+# What a rebuild replaces, everything the answers are computed from
+INDEX_STATE = ('item_ids', 'favorites', 'cooccurrence', 'item_index', 'user_index',
+               'overrides', 'top', 'version')
+
+# numpy and scipy are a large share of the app's import time, they are only
+# imported once a related route first builds an index
+np = None
+sparse = None
+
+
+def import_arrays():
+    global np, sparse
+    if np is None:
+        import numpy
+        from scipy import sparse as scipy_sparse
+        np, sparse = numpy, scipy_sparse
+
+
+class RelatedIndex:
+    """Items most often favorited by the same users, for one kind of favorite.
+
+    The user x item matrix A is built in bulk and the item x item
+    co-occurrence matrix is A.T @ A. Favorites changed by this worker are
+    folded in as a sparse delta for just the users involved, and the top-K
+    lists are only recomputed for the items whose counts moved.
+
+    The index always answers as of one version of the favorites table, the
+    one in `version`, so the ETag can be built from it. Changes from other
+    workers make it stale until a rebuild in a background thread replaces it.
+    """
+
+    def __init__(self, model, target, top_k=RELATED_TOP_K):
+        self.model = model
+        self.target = target
+        self.column = getattr(model, target_column(target))
+        self.top_k = top_k
+        self.lock = threading.Lock()
+        self.pending_users = set()
+        # Commits from this worker since the index was last in sync, each
+        # one bumped the table's version once
+        self.pending_commits = 0
+        self.built_at = None
+        self.rebuilding = False
+        self.version = None
+
+    def load_pairs(self, user_ids=None):
+        stmt = db.select(self.model.user_id, self.column)
+        if user_ids is not None:
+            stmt = stmt.where(self.model.user_id.in_(user_ids))
+        pairs = np.array(db.session.execute(stmt).all(), dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def build(self):
+        import_arrays()
+        # Read first, so the pairs are at least as new as the version
+        self.version = current_versions([self.model.__tablename__])[0]
+        users, items = self.load_pairs()
+        self.item_ids, item_rows = np.unique(items, return_inverse=True)
+        user_ids, user_rows = np.unique(users, return_inverse=True)
+        self.favorites = sparse.csr_matrix(
+            (np.ones(len(items), dtype=np.int32), (user_rows, item_rows)),
+            shape=(len(user_ids), len(self.item_ids)))
+        self.cooccurrence = (self.favorites.T @ self.favorites).tocsr()
+        self.item_index = dict(zip(self.item_ids.tolist(), range(len(self.item_ids))))
+        self.user_index = dict(zip(user_ids.tolist(), range(len(user_ids))))
+        # Item rows for users changed since the build, A itself is never edited
+        self.overrides = {}
+        self.top = {}
+        self.update_top(range(len(self.item_ids)))
+
+    def user_rows(self, user_id):
+        if user_id in self.overrides:
+            return self.overrides[user_id]
+        row = self.user_index.get(user_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        A = self.favorites
+        return A.indices[A.indptr[row]:A.indptr[row + 1]]
+
+    def add_items(self, item_ids):
+        new = np.setdiff1d(item_ids, self.item_ids)
+        if len(new) == 0:
+            return
+        self.item_index.update(zip(new.tolist(), range(len(self.item_ids), len(self.item_ids) + len(new))))
+        self.item_ids = np.concatenate([self.item_ids, new])
+        self.cooccurrence.resize((len(self.item_ids), len(self.item_ids)))
+
+    def user_matrix(self, rows_per_user):
+        lengths = [len(rows) for rows in rows_per_user]
+        columns = np.concatenate(rows_per_user) if rows_per_user else np.empty(0, dtype=np.int64)
+        return sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.int32), columns,
+             np.concatenate([[0], np.cumsum(lengths)])),
+            shape=(len(rows_per_user), len(self.item_ids)))
+
+    def apply_pending(self):
+        user_ids = sorted(self.pending_users)
+        self.pending_users.clear()
+        users, items = self.load_pairs(user_ids)
+        self.add_items(np.unique(items))
+
+        # Group the fresh rows by user in one sort instead of a loop over pairs
+        order = np.argsort(users, kind='stable')
+        users, items = users[order], items[order]
+        item_rows = np.array([self.item_index[item] for item in items.tolist()], dtype=np.int64)
+        bounds = np.searchsorted(users, user_ids, side='left'), np.searchsorted(users, user_ids, side='right')
+        new_rows = [np.sort(item_rows[start:end]) for start, end in zip(*bounds)]
+        old_rows = [self.user_rows(user_id) for user_id in user_ids]
+
+        old, new = self.user_matrix(old_rows), self.user_matrix(new_rows)
+        delta = (new.T @ new - old.T @ old).tocsr()
+        delta.eliminate_zeros()
+        if delta.nnz:
+            self.cooccurrence = (self.cooccurrence + delta).tocsr()
+            self.cooccurrence.eliminate_zeros()
+            self.update_top(np.unique(delta.nonzero()[0]))
+        self.overrides.update(zip(user_ids, new_rows))
+
+    def update_top(self, rows):
+        C = self.cooccurrence
+        k = self.top_k
+        for row in rows:
+            columns = C.indices[C.indptr[row]:C.indptr[row + 1]]
+            counts = C.data[C.indptr[row]:C.indptr[row + 1]]
+            keep = columns != row
+            columns, counts = columns[keep], counts[keep]
+            if len(columns) > k:
+                best = np.argpartition(-counts, k)[:k]
+                columns, counts = columns[best], counts[best]
+            # Highest count first, ties broken by the lower id
+            order = np.lexsort((self.item_ids[columns], -counts))
+            item_id = int(self.item_ids[row])
+            self.top[item_id] = list(zip(self.item_ids[columns][order].tolist(),
+                                         counts[order].tolist()))
+
+    def rebuild(self, app):
+        try:
+            with app.app_context():
+                fresh = RelatedIndex(self.model, self.target, self.top_k)
+                fresh.build()
+            with self.lock:
+                for name in INDEX_STATE:
+                    setattr(self, name, getattr(fresh, name))
+                # Commits counted so far may be in the rebuilt version or
+                # not, the users are applied again either way
+                self.pending_commits = 0
+        finally:
+            self.rebuilding = False
+
+    def refresh(self):
+        """Version the index answers as of, after bringing it as close to the
+        table's as it can without a full rebuild on this request"""
+        with self.lock:
+            version = current_versions([self.model.__tablename__])[0]
+            if self.built_at is None:
+                # Nothing to answer with yet, only the first build runs here
+                self.pending_users.clear()
+                self.pending_commits = 0
+                self.build()
+                self.built_at = time.monotonic()
+            elif self.pending_commits and version == self.version + self.pending_commits:
+                # Only this worker's commits since the index was last in
+                # sync, applying them brings it up to the table's version
+                if self.pending_users:
+                    self.apply_pending()
+                self.pending_commits = 0
+                self.version = version
+            elif (version != self.version and not self.rebuilding
+                    and time.monotonic() - self.built_at > RELATED_MAX_AGE):
+                self.rebuilding = True
+                self.built_at = time.monotonic()
+                threading.Thread(target=self.rebuild, args=(current_app._get_current_object(),),
+                                 name=f'related-{self.model.__tablename__}', daemon=True).start()
+            return self.version
+
+    def related(self, item_id):
+        with self.lock:
+            return self.top.get(item_id, [])
+
+
+related_indexes = {kind: RelatedIndex(model, target)
+                   for kind, (model, target) in FAVORITE_KINDS.items()}
+indexes_by_model = {index.model: index for index in related_indexes.values()}
+indexes_by_table = {index.model.__tablename__: index for index in related_indexes.values()}
+
+
+@event.listens_for(Session, 'after_commit')
+def queue_changed_users(session):
+    for model, user_id in session.info.pop(FAVORITE_CHANGES, ()):
+        index = indexes_by_model[model]
+        with index.lock:
+            index.pending_users.add(user_id)
+    # Counted whether or not a favorite actually changed, the version moves
+    # with every write to the table
+    for table in session.info.pop(BUMPED_TABLES, ()):
+        index = indexes_by_table.get(table)
+        if index is not None:
+            with index.lock:
+                index.pending_commits += 1
+
+
+def related_versions(kind):
+    """Versions for conditional() with the favorites table's taken from the
+    index, which lags behind the table while a rebuild is pending"""
+    index = related_indexes[kind]
+
+    def versions(tables):
+        return [index.refresh() if table == index.model.__tablename__ else version
+                for table, version in zip(tables, current_versions(tables))]
+    return versions
+
+
+def related_items(kind, item_id, top):
+    model, target = FAVORITE_KINDS[kind]
+    index = related_indexes[kind]
+    if index.built_at is None:
+        index.refresh()
+    scores = dict(index.related(item_id)[:top])
+    if not scores:
+        return []
+    pk = inspect(target).primary_key[0]
+    rows = fetch_rows(select_rows(target).where(pk.in_(scores)), target)
+    results = [dict(row.serialize(), score=scores[getattr(row, pk.key)]) for row in rows]
+    return sorted(results, key=lambda result: (-result['score'], result[pk.key]))
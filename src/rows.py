@@ -0,0 +1,48 @@
+from functools import lru_cache
+from sqlalchemy import inspect
+from models import db
+from fieldsets import serialized_columns
+
+
+@lru_cache
+def row_class(model, extra=()):
+    """Read-only stand-in for a model instance built from a result row.
+
+    Only the serialized columns, plus any extra ones, are slots and
+    serialize() returns the same dict as the model's, but there is no
+    session, identity map or change tracking behind it."""
+    columns = serialized_columns(model)
+    slots = columns + tuple(extra)
+    # __init__ unpacks the tuple and serialize() builds a dict literal, both
+    # generated once so there is no per column loop at runtime
+    source = (f"def __init__(self, row):\n"
+              f"    {''.join(f'self.{name}, ' for name in slots)}= row\n"
+              f"def serialize(self):\n"
+              f"    return {{{', '.join(f'{name!r}: self.{name}' for name in columns)}}}\n")
+    namespace = {}
+    exec(source, namespace)
+    return type(f'{model.__name__}Row', (), {
+        '__slots__': slots,
+        '__init__': namespace['__init__'],
+        'serialize': namespace['serialize'],
+        '__repr__': lambda self: f'<{type(self).__name__} {getattr(self, slots[0])}>',
+    })
+
+
+def select_rows(model, extra=()):
+    return db.select(*[getattr(model, name) for name in row_class(model, extra).__slots__])
+
+
+def make_rows(result, model, extra=()):
+    return list(map(row_class(model, extra), result))
+
+
+def fetch_rows(stmt, model, extra=()):
+    """Rows of a statement built on select_rows() with the same arguments"""
+    return make_rows(db.session.execute(stmt), model, extra)
+
+
+def get_row(model, id):
+    pk = inspect(model).primary_key[0]
+    rows = fetch_rows(select_rows(model).where(pk == id), model)
+    return rows[0] if rows else None
@@ -0,0 +1,145 @@
+import re
+from flask import request
+from sqlalchemy import event, text
+from models import db
+from utils import APIException
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# kind, table, primary key, title expression, details expression
+SEARCHABLE = [
+    ('people', 'characters', 'character_id', "coalesce({0}name, '')", "''"),
+    ('planets', 'planets', 'planet_id', "coalesce({0}planet_name, '')",
+     "coalesce({0}climate, '') || ' ' || coalesce({0}terrain, '')"),
+    ('vehicles', 'vehicles', 'vehicle_id', "coalesce({0}vehicle_name, '')",
+     "coalesce({0}model, '')"),
+]
+# Updates to any other column, such as the favorite counters, leave the
+# index alone
+INDEXED_COLUMNS = {
+    'characters': ('character_id', 'name'),
+    'planets': ('planet_id', 'planet_name', 'climate', 'terrain'),
+    'vehicles': ('vehicle_id', 'vehicle_name', 'model'),
+}
+
+
+def sqlite_ddl():
+    # One FTS5 table for every kind. The rowid packs kind and id together so
+    # the triggers can replace a row with a rowid lookup instead of a scan.
+    statements = ["CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                  "kind UNINDEXED, entity_id UNINDEXED, title, details, "
+                  "tokenize='unicode61 remove_diacritics 2')"]
+    for code, (kind, table, pk, title, details) in enumerate(SEARCHABLE, start=1):
+        rowid = f'{{0}}{pk} * 4 + {code}'
+        insert = (f"INSERT INTO search_index (rowid, kind, entity_id, title, details) "
+                  f"VALUES ({rowid.format('new.')}, '{kind}', new.{pk}, "
+                  f"{title.format('new.')}, {details.format('new.')});")
+        delete = f"DELETE FROM search_index WHERE rowid = {rowid.format('old.')};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} "
+            f"BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update "
+            f"AFTER UPDATE OF {', '.join(INDEXED_COLUMNS[table])} ON {table} "
+            f"BEGIN {delete} {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} "
+            f"BEGIN {delete} END",
+        ]
+    return statements
+
+
+def sqlite_rebuild():
+    statements = ['DELETE FROM search_index']
+    for code, (kind, table, pk, title, details) in enumerate(SEARCHABLE, start=1):
+        statements.append(
+            f"INSERT INTO search_index (rowid, kind, entity_id, title, details) "
+            f"SELECT {pk} * 4 + {code}, '{kind}', {pk}, {title.format('')}, "
+            f"{details.format('')} FROM {table}")
+    return statements
+
+
+def postgresql_ddl():
+    # Generated columns are kept up to date by Postgres on every write
+    statements = []
+    for kind, table, pk, title, details in SEARCHABLE:
+        vector = (f"setweight(to_tsvector('simple', {title.format('')}), 'A') || "
+                  f"setweight(to_tsvector('simple', {details.format('')}), 'B')")
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({vector}) STORED",
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} "
+            f"USING GIN (search_vector)",
+        ]
+    return statements
+
+
+def create_search_index(connection, rebuild=False):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = sqlite_ddl() + (sqlite_rebuild() if rebuild else [])
+    elif dialect == 'postgresql':
+        statements = postgresql_ddl()
+    else:
+        return
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def drop_search_index(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        # The triggers would otherwise fail every write to the tables
+        for kind, table, pk, title, details in SEARCHABLE:
+            for operation in ('insert', 'update', 'delete'):
+                connection.execute(text(f'DROP TRIGGER IF EXISTS {table}_search_{operation}'))
+        connection.execute(text('DROP TABLE IF EXISTS search_index'))
+    elif dialect == 'postgresql':
+        for kind, table, pk, title, details in SEARCHABLE:
+            connection.execute(
+                text(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector'))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index_with_tables(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index_with_tables(target, connection, **kw):
+    drop_search_index(connection)
+
+
+def search_terms(q):
+    terms = re.findall(r'\w+', q or '')
+    if not terms:
+        raise APIException('q must contain at least one word', status_code=400)
+    return terms
+
+
+def search(q, limit):
+    terms = search_terms(q)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # Every term must match, the last one also as a prefix
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        stmt = text("SELECT kind, entity_id, title, -bm25(search_index, 0, 0, 10.0, 1.0) AS score "
+                    "FROM search_index WHERE search_index MATCH :match "
+                    "ORDER BY bm25(search_index, 0, 0, 10.0, 1.0) LIMIT :limit")
+    elif dialect == 'postgresql':
+        match = ' & '.join(terms) + ':*'
+        stmt = text(' UNION ALL '.join(
+            f"SELECT '{kind}' AS kind, {pk} AS entity_id, {title.format('')} AS title, "
+            f"ts_rank(search_vector, to_tsquery('simple', :match)) AS score FROM {table} "
+            f"WHERE search_vector @@ to_tsquery('simple', :match)"
+            for kind, table, pk, title, details in SEARCHABLE) + ' ORDER BY score DESC LIMIT :limit')
+    else:
+        raise APIException('Search is not available on this database', status_code=501)
+
+    rows = db.session.execute(stmt, {'match': match, 'limit': limit})
+    return [{'kind': kind, 'id': entity_id, 'title': title, 'score': score}
+            for kind, entity_id, title, score in rows]
+
+
+def get_search_args():
+    limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+    return request.args.get('q', ''), max(1, min(limit, MAX_SEARCH_LIMIT))
@@ -0,0 +1,57 @@
+import os
+import click
+
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def serving():
+    """False when the app is loaded for a flask command other than `flask run`.
+    Servers such as gunicorn import it outside of any click context."""
+    context = click.get_current_context(silent=True)
+    return context is None or context.command.name == 'run'
+
+
+# The admin UI only matters to a server, commands such as `flask db upgrade`
+# skip it unless asked for
+ADMIN_ENABLED = env_flag('ADMIN_ENABLED', serving())
+
+
+class LazyGroup(click.Group):
+    """Command group whose real commands are loaded the first time it runs"""
+
+    def __init__(self, name, load, **kwargs):
+        super().__init__(name, **kwargs)
+        self.load = load
+        self.loaded = None
+
+    def group(self):
+        if self.loaded is None:
+            self.loaded = self.load()
+        return self.loaded
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # Parsed and invoked as the real group, with its options and callback
+        return self.group().make_context(info_name, args, parent=parent, **extra)
+
+    def list_commands(self, ctx):
+        return self.group().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self.group().get_command(ctx, name)
+
+
+def setup_migrate(app, db):
+    """`flask db` without importing Flask-Migrate and alembic, about half of
+    the import time, until a db command actually runs"""
+    def load():
+        from flask_migrate import Migrate
+        # Registers the real db group on app.cli in place of this one
+        Migrate(app, db)
+        return app.cli.get_command(None, 'db')
+
+    app.cli.add_command(LazyGroup('db', load, help='Perform database migrations.'))
@@ -0,0 +1,50 @@
+import os
+from flask import Response, request, stream_with_context
+from models import db
+from pagination import decode_cursor, list_statement
+from fieldsets import get_fields
+from rowjson import row_encoder
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 1000))
+
+
+def wants_ndjson():
+    # Only an explicit NDJSON entry counts, a bare */* keeps the JSON default
+    return any(mimetype == NDJSON_MIMETYPE and quality > 0
+               for mimetype, quality in request.accept_mimetypes)
+
+
+def wants_stream():
+    return request.args.get('stream') in ('1', 'true') or wants_ndjson()
+
+
+def iter_rows(stmt):
+    # yield_per keeps a server-side cursor open and only buffers one batch of
+    # rows at a time, so memory does not grow with the table
+    stmt = stmt.execution_options(yield_per=STREAM_BATCH_SIZE)
+    return db.session.execute(stmt)
+
+
+def stream_collection(model, pk, key):
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    encoder = row_encoder(model, get_fields(model))
+    # Build the statement up front so bad arguments fail before streaming starts
+    stmt, keys = list_statement(model, pk, encoder.columns, after)
+    encode_row = encoder.encode_row
+
+    if wants_ndjson():
+        def generate():
+            for row in iter_rows(stmt):
+                yield encode_row(row) + '\n'
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield '{"' + key + '": ['
+        separator = ''
+        for row in iter_rows(stmt):
+            yield separator + encode_row(row)
+            separator = ','
+        yield '], "next": null}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,96 @@
+import hashlib
+from functools import wraps
+from itertools import chain
+from flask import request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, TableVersion
+
+TOUCHED_TABLES = 'touched_tables'
+# Tables whose version the committing transaction bumped, for after_commit
+BUMPED_TABLES = 'bumped_tables'
+
+
+def touch(session, *tables):
+    tables = set(tables) - {TableVersion.__tablename__}
+    if tables:
+        session.info.setdefault(TOUCHED_TABLES, set()).update(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_flushed_tables(session, flush_context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        touch(session, instance.__table__.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_executed_tables(orm_execute_state):
+    # Bulk statements skip the flush, so pick their table up here
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        touch(orm_execute_state.session, orm_execute_state.statement.table.name)
+
+
+@event.listens_for(Session, 'before_commit')
+def bump_table_versions(session):
+    # Bump inside the committing transaction so readers never see new rows
+    # with an old version
+    session.flush()
+    tables = sorted(session.info.pop(TOUCHED_TABLES, ()))
+    if not tables:
+        return
+    updated = session.execute(db.update(TableVersion).where(TableVersion.table_name.in_(tables)).values(
+        version=TableVersion.version + 1)).rowcount
+    if updated < len(tables):
+        # Only the first write to a table the migrations didn't seed gets
+        # here, a plain insert of the missing rows works on every backend
+        existing = set(session.execute(db.select(TableVersion.table_name).where(
+            TableVersion.table_name.in_(tables))).scalars())
+        session.execute(db.insert(TableVersion), [{'table_name': table, 'version': 1}
+                                                  for table in tables if table not in existing])
+    session.info[BUMPED_TABLES] = tables
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_touched_tables(session):
+    session.info.pop(TOUCHED_TABLES, None)
+    session.info.pop(BUMPED_TABLES, None)
+
+
+def current_versions(tables):
+    stmt = db.select(TableVersion.table_name, TableVersion.version).where(
+        TableVersion.table_name.in_(tables))
+    versions = dict(db.session.execute(stmt).all())
+    return [versions.get(table, 0) for table in tables]
+
+
+def etag_for(full_path, accept, tables, versions):
+    parts = [full_path, accept]
+    parts += [f'{table}:{version}' for table, version in zip(tables, versions)]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def make_etag(tables, versions=current_versions):
+    return etag_for(request.full_path, request.headers.get('Accept', ''),
+                    tables, versions(tables))
+
+
+def conditional(*tables, versions=current_versions):
+    """Answer If-None-Match with a 304 before the view touches the ORM.
+    `versions` maps the tables to the versions the response is built from,
+    for views that answer from something lagging behind the tables."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(tables, versions)
+            # Weak comparison, compressed responses carry the ETag as weak
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app reads its configuration when it is first imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='starwars-tests-'), 'test.db')
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ.setdefault('TOKEN_SECRET', 'test secret')
+os.environ.setdefault('ADMIN_ENABLED', '0')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def app():
+    from app import app
+    from models import db
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
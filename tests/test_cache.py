@@ -0,0 +1,71 @@
+import time
+import pytest
+import cache
+from cache import RedisCache, WHOLE_TABLE, entity_cache
+from models import db, Characters
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def redis_cache(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache.redis.Redis, 'from_url',
+                        lambda url: fakeredis.FakeRedis(server=server))
+    return RedisCache(ttl=30)
+
+
+def test_redis_round_trip(redis_cache):
+    key = ('characters', 1)
+    assert redis_cache.get(key) is None
+    redis_cache.set(key, {'name': 'Luke'}, redis_cache.generation('characters'))
+    assert redis_cache.get(key) == {'name': 'Luke'}
+    assert 0 < redis_cache.client.ttl(redis_cache.entry_key(key)) <= 30
+    assert (redis_cache.hits, redis_cache.misses, redis_cache.size()) == (1, 1, 1)
+
+
+def test_redis_skips_payloads_loaded_before_an_invalidation(redis_cache):
+    generation = redis_cache.generation('characters')
+    redis_cache.invalidate('characters', 1)
+    redis_cache.set(('characters', 1), {'name': 'stale'}, generation)
+    assert redis_cache.get(('characters', 1)) is None
+
+
+def test_redis_invalidates_one_row_or_the_whole_table(redis_cache):
+    for key in [('characters', 1), ('characters', 2), ('planets', 1)]:
+        redis_cache.set(key, {'id': key[1]}, redis_cache.generation(key[0]))
+    redis_cache.invalidate('characters', 1)
+    assert redis_cache.get(('characters', 1)) is None
+    assert redis_cache.get(('characters', 2)) == {'id': 2}
+    redis_cache.invalidate('characters', WHOLE_TABLE)
+    assert redis_cache.get(('characters', 2)) is None
+    assert redis_cache.get(('planets', 1)) == {'id': 1}
+
+
+def test_redis_revoked_tokens_expire_and_survive_clear(redis_cache):
+    redis_cache.revoke('token', time.time() + 60)
+    redis_cache.set(('characters', 1), {}, 0)
+    redis_cache.clear()
+    assert redis_cache.is_revoked('token')
+    assert not redis_cache.is_revoked('other')
+    assert redis_cache.size() == 0
+    assert 0 < redis_cache.client.ttl(redis_cache.revoked_key('token')) <= 61
+
+
+def test_redis_workers_share_entries(redis_cache):
+    # A second instance stands in for another worker on the same server
+    other = RedisCache()
+    redis_cache.set(('planets', 3), {'id': 3}, 0)
+    assert other.get(('planets', 3)) == {'id': 3}
+    other.invalidate('planets', 3)
+    assert redis_cache.get(('planets', 3)) is None
+
+
+def test_bulk_writes_only_invalidate_cached_tables(app):
+    db.session.add(Characters(name='Luke', gender='m', height=172, weight=77, birthdate='19BBY'))
+    db.session.commit()
+    before = {table: entity_cache.generation(table) for table in ('characters', 'table_version')}
+    db.session.execute(db.update(Characters).values(height=173))
+    db.session.commit()
+    assert entity_cache.generation('characters') == before['characters'] + 1
+    assert entity_cache.generation('table_version') == before['table_version']
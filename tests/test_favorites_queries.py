@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import event
+from models import db, User, Characters, Planets, Vehicles, FavoriteCharacters, FavoritePlanets, FavoriteVehicles
+
+
+def add_user_with_favorites(count):
+    user = User(email=f'user{count}@example.com', password='x', username=f'user{count}',
+                first_name='Test', last_name='User')
+    db.session.add(user)
+    for number in range(count):
+        character = Characters(name=f'Character {number}', gender='n/a', height=1, weight=1, birthdate='0BBY')
+        planet = Planets(planet_name=f'Planet {number}', climate='arid', terrain='desert',
+                         day_length_hours=1, year_length_days=1, population=1)
+        vehicle = Vehicles(vehicle_name=f'Vehicle {number}', cargo_capacity=1.0, number_passengers=1,
+                           number_crew=1, model='T-16', cost=1)
+        db.session.add_all([
+            FavoriteCharacters(user=user, character=character),
+            FavoritePlanets(user=user, planet=planet),
+            FavoriteVehicles(user=user, vehicle=vehicle),
+        ])
+    db.session.commit()
+    return user.user_id
+
+
+def count_queries(client, path):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+@pytest.mark.parametrize('count', [5, 20])
+def test_favorites_query_count_does_not_grow_with_favorites(client, count):
+    one = add_user_with_favorites(1)
+    many = add_user_with_favorites(count)
+
+    one_body, one_queries = count_queries(client, f'/users/{one}/favorites')
+    many_body, many_queries = count_queries(client, f'/users/{many}/favorites')
+
+    assert [len(one_body[key]) for key in one_body] == [1, 1, 1]
+    assert [len(many_body[key]) for key in many_body] == [count] * 3
+    assert one_queries == many_queries
@@ -0,0 +1,31 @@
+import pytest
+from models import db, User, Characters
+
+
+@pytest.mark.parametrize('body', [[], [{'kind': 'people'}], 'operations', 1])
+def test_batch_rejects_a_body_that_is_not_an_object(client, body):
+    response = client.post('/favorites/batch', json=body)
+    assert response.status_code == 400
+
+
+def test_batch_reports_operations_that_are_not_objects(client):
+    response = client.post('/favorites/batch', json={'operations': [[1, 2], 'add']})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['invalid', 'invalid']
+
+
+def test_delete_favorite_statuses(client):
+    db.session.add(User(email='luke@example.com', password='x', username='luke', first_name='Luke', last_name='S'))
+    db.session.add(Characters(name='Yoda', gender='male', height=66, weight=17, birthdate='896BBY'))
+    db.session.commit()
+
+    assert client.post('/favorite/people/1/user/1').status_code == 200
+    response = client.delete('/favorite/people/1/user/1')
+    assert (response.status_code, response.get_json()['msg']) == (200, 'Favorite character deleted successfully')
+    response = client.delete('/favorite/people/1/user/1')
+    assert (response.status_code, response.get_json()['msg']) == (200, 'Favorite doesnt exist')
+    response = client.delete('/favorite/people/1/user/2')
+    assert (response.status_code, response.get_json()['msg']) == (404, 'User doesnt exist')
+    response = client.delete('/favorite/people/2/user/1')
+    assert (response.status_code, response.get_json()['msg']) == (404, 'Character doesnt exist')
+    assert db.session.get(Characters, 1).favorite_count == 0
@@ -0,0 +1,36 @@
+import io
+import pytest
+from importer import import_file, to_int, to_float
+from models import db, Characters
+
+
+@pytest.mark.parametrize('value', ['1e400', '-1e400', 'nan', 'inf', float('nan'), float('inf'), 10 ** 400,
+                                   '30-165', 'unknown', ''])
+def test_numbers_no_column_can_hold_are_unknown(value):
+    assert to_int(value) is None
+    assert to_float(value) is None
+
+
+@pytest.mark.parametrize('value, integer, number', [
+    ('12', 12, 12.0),
+    ('1,000', 1000, 1000.0),
+    (3.7, 3, 3.7),
+    ('3e9', None, 3e9),
+])
+def test_numbers(value, integer, number):
+    assert to_int(value) == integer
+    assert to_float(value) == number
+
+
+def test_upsert_only_updates_the_columns_a_record_has(app):
+    db.session.add(Characters(name='Luke Skywalker', gender='male', height=172, weight=77, birthdate='19BBY'))
+    db.session.commit()
+
+    summary = import_file('people', io.StringIO(
+        '{"name": "Luke Skywalker", "height": "180"}\n'
+        '{"name": "Jabba Desilijic Tiure", "gender": "hermaphrodite"}\n'), 'ndjson', upsert=True)
+
+    assert (summary['inserted'], summary['updated'], summary['truncated']) == (1, 1, 1)
+    luke, jabba = db.session.execute(db.select(Characters).order_by(Characters.character_id)).scalars()
+    assert (luke.gender, luke.height, luke.weight, luke.birthdate) == ('male', 180, 77, '19BBY')
+    assert (jabba.gender, jabba.height, jabba.birthdate) == ('hermaphrod', 0, 'N/A')
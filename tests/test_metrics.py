@@ -0,0 +1,6 @@
+def test_metrics_content_type(client):
+    client.get('/people')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    assert b'endpoint="get_characters"' in response.data
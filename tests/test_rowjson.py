@@ -0,0 +1,19 @@
+import re
+import pytest
+from json_provider import JSON_PROVIDERS, orjson
+from models import db, Characters
+
+PROVIDERS = [name for name in JSON_PROVIDERS if name != 'orjson' or orjson is not None]
+
+
+@pytest.mark.parametrize('provider', PROVIDERS)
+def test_list_and_detail_encode_strings_alike(app, client, monkeypatch, provider):
+    monkeypatch.setattr(app, 'json', JSON_PROVIDERS[provider](app))
+    db.session.add(Characters(name='Padmé Amidala', gender='female', height=165, weight=45, birthdate='46BBY'))
+    db.session.commit()
+
+    listed = client.get('/people').data
+    detail = client.get('/people/1').data
+    name = re.search(rb'"name":"[^"]*"', detail).group()
+    assert name in listed
+    assert (b'\\u00e9' in name) == app.json.ensure_ascii